@@ -1,33 +1,90 @@
 import streamlit as st
-import json
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
+import streamlit.components.v1 as components
+import os
+import uuid
+import copy
+import hmac
+import secrets
 from pathlib import Path
 import math
+import perf
+from journal import Journal, rejouer, modifs_finales
+from modele import Perso, Entree
+from connexion import Demarrage, ouvrir_repertoire
+from stockage import Repertoire, FileSauvegarde, resume, fusionner, appliquer_modifs
 
 # --- CONFIGURATION ---
 st.set_page_config(page_title="D&D Manager V23", page_icon="🐉", layout="wide")
+cadre_script = perf.mesures.demarrer("script")
+
+# Mesures : panneau latéral avec ?perf=1, lignes de log JSON avec DND_PERF=1
+PERF_JOURNAL = os.environ.get("DND_PERF") == "1"
+if PERF_JOURNAL: perf.activer_journal()
+if st.query_params.get("perf") == "1": perf.activer_octets()
 
 # --- CONNEXION HYBRIDE ---
-SCOPE = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+def lire_config():
+    # [stockage] dans secrets.toml, surchargeable par variables d'environnement
+    conf = {}
+    try: conf.update(st.secrets.get("stockage", {}))
+    except: pass
+    if os.environ.get("DND_BACKEND"): conf["backend"] = os.environ["DND_BACKEND"]
+    if os.environ.get("DND_SQLITE"): conf["chemin"] = os.environ["DND_SQLITE"]
+    return conf
+
+def compte_google():
+    local_key = Path("service_account.json")
+    if local_key.is_file(): return local_key
+    try:
+        if "gcp_service_account" in st.secrets: return dict(st.secrets["gcp_service_account"])
+    except: pass
+    return None
 
 @st.cache_resource
 def init_connection():
-    try:
-        local_key = Path("service_account.json")
-        if local_key.is_file():
-            creds = ServiceAccountCredentials.from_json_keyfile_name("service_account.json", SCOPE)
-        elif "gcp_service_account" in st.secrets:
-            creds_dict = dict(st.secrets["gcp_service_account"])
-            creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, SCOPE)
-        else:
-            return None
-        client = gspread.authorize(creds)
-        sheet = client.open("DndData").sheet1
-        return sheet
-    except: return None
-
-sheet = init_connection()
+    # Un seul démarrage par processus, en tâche de fond : la page s'affiche pendant la connexion
+    conf, compte = lire_config(), compte_google()
+    def ouvrir():
+        with perf.chrono("init_connection"): return ouvrir_repertoire(conf, compte)
+    return Demarrage(ouvrir)
+
+demarrage = init_connection()
+if not demarrage.attendre(0):
+    squelette = st.empty()
+    with squelette.container():
+        st.title("🐉 D&D Manager")
+        with st.spinner('Connexion Cloud...'): demarrage.attendre()
+    squelette.empty()
+if demarrage.erreur is not None:
+    st.title("🐉 D&D Manager")
+    st.error(f"Connexion impossible : {demarrage.erreur}")
+    if st.button("🔄 Réessayer"):
+        demarrage.relancer()
+        st.rerun()
+    st.stop()
+repertoire = demarrage.repertoire
+
+@st.cache_resource
+def init_file_sauvegarde(_backend, campagne):
+    # Thread d'écriture partagé par toutes les sessions, un par campagne
+    return FileSauvegarde(_backend) if _backend is not None else None
+
+# Campagne active : seule sa partition est lue et écrite
+if "campagne" not in st.session_state:
+    st.session_state.campagne = st.query_params.get("campagne", Repertoire.DEFAUT)
+try: backend = repertoire.backend(st.session_state.campagne)
+except Exception:  # campagne inconnue ou onglet illisible : retour à la principale
+    st.session_state.campagne = Repertoire.DEFAUT
+    backend = repertoire.backend(st.session_state.campagne)
+file_sauvegarde = init_file_sauvegarde(backend, st.session_state.campagne)
+
+@st.cache_resource
+def init_journal():
+    # Journal local des modifications : rien n'est perdu entre deux sauvegardes
+    return Journal(os.environ.get("DND_JOURNAL") or lire_config().get("journal", "journal"))
+
+journal = init_journal()
+if file_sauvegarde is not None: journal.brancher(st.session_state.campagne, file_sauvegarde)
 
 # --- CONSTANTES ---
 CLASSES_DATA = {
@@ -38,6 +95,12 @@ CLASSES_DATA = {
 }
 LISTE_CLASSES = sorted(list(CLASSES_DATA.keys()))
 
+# Lignes de compétences / objets affichées par page
+TAILLE_PAGE = 20
+
+# Suivi en direct des héros (s) : une vérification de révision par intervalle pour tout le serveur
+INTERVALLE_SUIVI = float(lire_config().get("suivi", 5))
+
 # Table d'XP
 XP_TABLE = {
     1: 300, 2: 900, 3: 2700, 4: 6500, 5: 14000,
@@ -47,158 +110,399 @@ XP_TABLE = {
 }
 
 # --- FONCTIONS BACKEND ---
-def charger_donnees():
-    if sheet is None: return {}
-    try:
-        records = sheet.get_all_values()
-        db = {}
-        for row in records[1:]:
-            if len(row) >= 2:
-                try: db[row[0]] = json.loads(row[1])
-                except: pass
-        return db
-    except: return {}
-
-def sauvegarder_donnees(data):
-    if sheet is None: return
-    try:
-        rows = [["NOM_PERSO", "DATA_JSON"]]
-        for nom, p_data in data.items():
-            rows.append([nom, json.dumps(p_data, ensure_ascii=False)])
-        sheet.clear()
-        sheet.update(rows)
+@perf.chronometrer("charger_donnees")
+def charger_donnees(age_max=None):
+    # Index léger (nom -> classe, niveau, PV, MAJ) depuis le cache serveur partagé
+    # None si le stockage ne répond pas : l'appelant garde l'ancien roster et le signale
+    if backend is None: return {}
+    try: db = backend.charger_index(age_max)
+    except Exception as e:
+        st.session_state.erreur_roster = e
+        return None
+    st.session_state.erreur_roster = None
+    # Sauvegardes de cette session encore dans la file : on affiche déjà leur état
+    for nom, data in file_sauvegarde.apercu(st.session_state.get("session_id")).items():
+        if data is None: db.pop(nom, None)
+        else: db[nom] = resume(data, rev=db.get(nom, {}).get("rev", 0))
+    return db
+
+@perf.chronometrer("charger_perso")
+def charger_perso(nom):
+    # DATA_JSON complet, lu et décodé seulement à l'ouverture.
+    # Renvoie (perso, base) ; base = (révision, data lu) sert au contrôle de concurrence
+    if backend is None: return None, None
+    en_attente = file_sauvegarde.lire(nom, st.session_state.session_id)
+    if en_attente is not None:
+        data, base = en_attente
+        perso = Perso.depuis_dict(data, base[1] if base else None)
+        perso.envoi()  # déjà dans la file : modifié depuis la base, mais plus à sauvegarder
+        return perso, base
+    try: data, rev = backend.charger_perso(nom)
+    except Exception as e:
+        st.error(f"Erreur Cloud: {e}")
+        return None, None
+    if data is None: return None, None
+    return Perso.depuis_dict(data), (rev, data)
+
+@perf.chronometrer("sauvegarder_donnees")
+def sauvegarder_donnees(modifies, supprimes=(), bases=None):
+    # Écriture différée : retour immédiat, le thread fusionne, regroupe et réessaie.
+    # modifies : nom -> Perso ; bases : nom -> (rev, data) chargés.
+    # Sur une version plus récente, seuls les champs modifiés sont réécrits
+    if file_sauvegarde is None: return
+    bases = bases or {}
+    sid = st.session_state.session_id
+    for nom, perso in modifies.items():
+        file_sauvegarde.soumettre(nom, perso.vers_dict(), sid, bases.get(nom), perso.envoi())
+    for nom in supprimes: file_sauvegarde.supprimer(nom, sid, bases.get(nom))
+
+@perf.chronometrer("action_groupe")
+def action_groupe(noms, action, xp_total=0, nb_joueurs=1):
+    # Vue MJ : persos lus en un appel, modifiés, puis une seule écriture groupée
+    # action : "Court" / "Long" (repos) ou "XP" (partage de xp_total entre nb_joueurs)
+    if backend is None or not noms: return []
+    sid = st.session_state.session_id
+    persos, bases = {}, {}
+    for nom in noms:
+        en_attente = file_sauvegarde.lire(nom, sid)
+        if en_attente is not None:
+            data, bases[nom] = en_attente
+            persos[nom] = Perso.depuis_dict(data, bases[nom][1] if bases[nom] else None)
+    a_lire = [nom for nom in noms if nom not in persos]
+    try: lus = backend.charger_persos(a_lire) if a_lire else {}
+    except Exception as e:
+        st.error(f"Erreur Cloud: {e}")
+        return []
+    for nom, (data, rev) in lus.items():
+        if data is not None: persos[nom], bases[nom] = Perso.depuis_dict(data), (rev, data)
+    gain = gain_xp(xp_total, nb_joueurs)
+    for perso in persos.values():
+        if action == "XP": perso.xp += gain
+        else: appliquer_repos(perso, action)
+    sauvegarder_donnees(persos, bases=bases)
+    return list(persos)
+
+def compacter_donnees():
+    # Réécriture complète de la feuille, uniquement sur demande explicite
+    if backend is None: return
+    try: backend.compacter()
     except Exception as e:
         st.error(f"Erreur Cloud: {e}")
 
 def nouveau_perso_template():
-    return {
+    return Perso.depuis_dict({
         "infos": {"nom": "Nouveau Héros", "race": "Humain", "classe": "Guerrier", "niveau": 1},
         "xp": 0,
         "hp": {"max": 10, "actuel": 10, "temp": 0},
         "hit_dice_used": 0,
-        "features": [],
-        "items": [],
+        "features": {},
+        "items": {},
+        "ordre": {"features": [], "items": []},
         "spells_active": False,
         "spells": {str(i): {"max": 0, "actuel": 0} for i in range(1, 10)} 
-    }
+    })
 
 def calculer_bm(niveau):
     return 2 + (niveau - 1) // 4
 
-def make_dirty():
-    st.session_state.unsaved_changes = True
+def gain_xp(total, nb_joueurs):
+    # Partage arrondi au supérieur : personne ne perd d'XP
+    return math.ceil(total / nb_joueurs) if nb_joueurs > 0 else 0
+
+def appliquer_repos(perso, type_repos):
+    if type_repos == "Court":
+        for f in perso.features.values():
+            if f.repos == "Court": f.actuel = f.max
+        for i in perso.items.values():
+            if i.repos == "Court": i.actuel = i.max
+    else:
+        bm = calculer_bm(perso.infos.niveau)
+        for f in perso.features.values():
+            if f.linked_pb: f.max = bm
+            f.actuel = f.max
+        for i in perso.items.values():
+            i.actuel = i.max
+        for emplacement in perso.spells.values():
+            emplacement.actuel = emplacement.max
+        perso.hit_dice_used = 0
+        perso.hp.actuel = perso.hp.max
+        perso.hp.temp = 0
+
+def rouvrir_journal():
+    # Nouvelle base écrite : le journal repart d'elle, avec ce qui reste à sauvegarder
+    perso, sid = st.session_state.perso, st.session_state.session_id
+    journal.ouvrir(sid, st.session_state.campagne, st.session_state.current_char_id, st.session_state.base)
+    for chemin in perso.non_ecrits(): journal.ajouter(sid, chemin, perso.valeur(chemin))
+    perso.recents()  # couverts ci-dessus
+
+def vider_journal():
+    # Appelé en fin de run : les valeurs affectées dans le corps du script sont à jour
+    if st.session_state.get("current_char_id") is None: return
+    perso, sid = st.session_state.perso, st.session_state.session_id
+    for chemin in perso.recents(): journal.ajouter(sid, chemin, perso.valeur(chemin))
+
+def supprimer_entree(liste_cle, cle):
+    st.session_state.perso.supprimer(liste_cle, cle)
+    st.session_state.edit_mode.pop(f"feat_{cle}", None)
+
+def reinitialiser_widgets():
+    # Les widgets à clé gardent leur ancienne valeur : on les oublie pour qu'ils relisent perso
+    for cle in list(st.session_state.keys()):
+        if cle.startswith(("w_clean_", "smx_", "ed_")) or cle in ("widget_xp_val", "widget_classe"):
+            del st.session_state[cle]
+
+def lire_chemin(data, chemin):
+    for cle in chemin:
+        data = data.get(cle) if isinstance(data, dict) else None
+    return data
 
 # --- CALLBACKS ---
+def cb_changer_campagne():
+    # Avant la relance : le haut du script ouvre directement la nouvelle partition
+    st.session_state.campagne = st.session_state.w_campagne
+    st.query_params["campagne"] = st.session_state.w_campagne
+
 def cb_manual_input(keys_path, widget_key):
-    val = st.session_state[widget_key]
-    ref = st.session_state.perso
-    for key in keys_path[:-1]: ref = ref[key]
-    ref[keys_path[-1]] = val
-    make_dirty()
+    st.session_state.perso.poser(keys_path, st.session_state[widget_key])
 
 def cb_xp_input():
-    new_val = st.session_state["widget_xp_val"]
-    st.session_state.perso["xp"] = new_val
-    make_dirty()
+    st.session_state.perso.xp = st.session_state["widget_xp_val"]
 
 def cb_update_spell(lvl, change):
-    perso = st.session_state.perso
-    current = perso["spells"][lvl]["actuel"]
-    maximum = perso["spells"][lvl]["max"]
-    new_val = current + change
-    if 0 <= new_val <= maximum:
-        perso["spells"][lvl]["actuel"] = new_val
-    make_dirty()
-
-def cb_update_feat(idx, change):
-    st.session_state.perso["features"][idx]["actuel"] += change
-    st.session_state.perso["features"] = st.session_state.perso["features"]
-    make_dirty()
-
-def cb_update_item(idx, change):
-    st.session_state.perso["items"][idx]["actuel"] += change
-    st.session_state.perso["items"] = st.session_state.perso["items"]
-    make_dirty()
-
-def cb_move_item(liste_cle, index, direction):
-    liste = st.session_state.perso[liste_cle]
-    new_index = index + direction
-    if 0 <= new_index < len(liste):
-        liste[index], liste[new_index] = liste[new_index], liste[index]
-        st.session_state.perso[liste_cle] = st.session_state.perso[liste_cle]
-        make_dirty()
+    emplacement = st.session_state.perso.spells[lvl]
+    new_val = emplacement.actuel + change
+    if 0 <= new_val <= emplacement.max:
+        emplacement.actuel = new_val
+
+def cb_update_feat(fid, change):
+    st.session_state.perso.features[fid].actuel += change
+
+def cb_update_item(iid, change):
+    st.session_state.perso.items[iid].actuel += change
+
+def cb_move_item(liste_cle, cle, direction):
+    # Seul l'ordre bouge : les entrées et leurs widgets gardent leur id
+    st.session_state.perso.deplacer(liste_cle, cle, direction)
 
 def cb_update_dv(change, max_dv):
-    current = st.session_state.perso.get("hit_dice_used", 0)
-    new_val = current + change
+    new_val = st.session_state.perso.hit_dice_used + change
     if 0 <= new_val <= max_dv:
-        st.session_state.perso["hit_dice_used"] = new_val
-    make_dirty()
+        st.session_state.perso.hit_dice_used = new_val
 
 def cb_change_classe():
-    new_classe = st.session_state.widget_classe
-    st.session_state.perso["infos"]["classe"] = new_classe
-    make_dirty()
+    st.session_state.perso.infos.classe = st.session_state.widget_classe
 
 def cb_apply_xp_gain():
     """Applique le calcul du dialog XP et met à jour l'affichage"""
     total = st.session_state.xp_calc_total
     nb_joueurs = st.session_state.xp_calc_nb
     if nb_joueurs > 0:
-        gain = math.ceil(total / nb_joueurs)
-        st.session_state.perso["xp"] += gain
+        gain = gain_xp(total, nb_joueurs)
+        st.session_state.perso.xp += gain
         # FIX V23 : On force la mise à jour du widget XP pour que l'affichage suive
-        st.session_state["widget_xp_val"] = st.session_state.perso["xp"]
-        make_dirty()
+        st.session_state["widget_xp_val"] = st.session_state.perso.xp
         st.toast(f"Gain de {gain} XP appliqué !")
 
 # --- COMPOSANTS VISUELS ---
 def compteur_propre(label, keys_path, min_val=0, max_val=1000):
-    val = st.session_state.perso
-    for k in keys_path: val = val[k]
+    val = st.session_state.perso.valeur(keys_path)
     widget_key = f"w_clean_{keys_path}"
     st.number_input(label, value=val, min_value=min_val, max_value=max_val, 
                     key=widget_key, on_change=cb_manual_input, args=(keys_path, widget_key))
 
+def filtrer_et_paginer(prefixe, entrees):
+    """Recherche + pagination sur les [(id, entrée)] ordonnés : renvoie les [(position, id, entrée)] à afficher et le mode compact."""
+    c_recherche, c_compact, c_page = st.columns([3, 1, 1])
+    def retour_page_1(): st.session_state[f"{prefixe}_page"] = 1
+    filtre = c_recherche.text_input("Rechercher", key=f"{prefixe}_filtre", placeholder="🔎 Rechercher",
+                                    label_visibility="collapsed", on_change=retour_page_1)
+    compact = c_compact.toggle("Compact", key=f"{prefixe}_compact")
+    visibles = [(pos, cle, e) for pos, (cle, e) in enumerate(entrees) if filtre.lower() in e.nom.lower()]
+    nb_pages = max(1, math.ceil(len(visibles) / TAILLE_PAGE))
+    page = 1
+    if nb_pages > 1:
+        if st.session_state.get(f"{prefixe}_page", 1) > nb_pages: st.session_state[f"{prefixe}_page"] = nb_pages
+        page = c_page.number_input("Page", 1, nb_pages, key=f"{prefixe}_page", label_visibility="collapsed")
+        c_page.caption(f"/ {nb_pages} ({len(visibles)})")
+    debut = (page - 1) * TAILLE_PAGE
+    return visibles[debut:debut + TAILLE_PAGE], compact
+
+def ligne_compacte(prefixe, cle, entree, callback):
+    # Nom + compteur seulement : 3 widgets au lieu d'une dizaine
+    c1, c_min, c_val, c_plus = st.columns([6, 0.7, 1, 0.7])
+    c1.write(f"**{entree.nom}**")
+    c_min.button("➖", key=f"{prefixe}m_{cle}", on_click=callback, args=(cle, -1), disabled=(entree.actuel==0))
+    c_val.write(f"{entree.actuel} / {entree.max}")
+    c_plus.button("➕", key=f"{prefixe}p_{cle}", on_click=callback, args=(cle, 1), disabled=(entree.actuel==entree.max))
+
+@st.fragment(run_every=1)
+def suivi_sauvegarde(nom):
+    # Se rafraîchit seul tant que l'écriture n'est pas confirmée
+    etat, message, heure = file_sauvegarde.statut(nom, st.session_state.session_id)
+    if etat in ("en_attente", "en_cours"):
+        st.caption(f"⏳ Sauvegarde en cours... {message}")
+    else: st.rerun()
+
+# Bilan d'une action de l'accueil : (fait, refusé sur un conflit)
+BILANS = {"Suppression": ("Supprimé(s) : {noms}.", "non supprimés")}
+BILAN_DEFAUT = ("{action} appliqué à {n} personnage(s).", "non appliqués")
+
+@st.fragment(run_every=1)
+def suivi_ecritures(cle):
+    # Accueil (groupe MJ, suppressions) : attend les écritures, puis en garde le bilan.
+    # Les résultats sont consommés ici : aucun ne ressort à l'ouverture d'un personnage
+    action, noms = st.session_state[f"{cle}_suivi"]
+    sid = st.session_state.session_id
+    statuts = {nom: file_sauvegarde.statut(nom, sid) for nom in noms}
+    restants = [nom for nom, s in statuts.items() if s and s[0] in ("en_attente", "en_cours")]
+    if restants:
+        st.caption(f"⏳ {action} : {len(noms) - len(restants)}/{len(noms)} personnage(s) écrit(s)...")
+        return
+    bilan = {"ok": [], "conflit": [], "echec": []}
+    for nom, s in statuts.items():
+        file_sauvegarde.resultat(nom, sid)  # consommé : l'accueil n'a pas de perso ouvert à rebaser
+        etat = s[0] if s else "echec"
+        bilan["ok" if etat == "fusion" else etat].append(nom)
+    st.session_state[f"{cle}_suivi"] = None
+    st.session_state[f"{cle}_bilan"] = (action, bilan)
+    st.rerun()
+
+def afficher_bilan(cle):
+    action, bilan = st.session_state[f"{cle}_bilan"]
+    fait, refuse = BILANS.get(action, BILAN_DEFAUT)
+    if bilan["ok"]: st.success(fait.format(action=action, n=len(bilan["ok"]), noms=", ".join(bilan["ok"])))
+    if bilan["conflit"]:
+        st.warning(f"Modifiés entre-temps par une autre session, {refuse} : {', '.join(bilan['conflit'])}")
+    if bilan["echec"]:
+        st.error(f"Écriture impossible : {', '.join(bilan['echec'])}")
+        if st.button("Réessayer", key=f"reessayer_{cle}"):
+            for nom in bilan["echec"]: file_sauvegarde.reessayer(nom, st.session_state.session_id)
+            st.session_state[f"{cle}_suivi"], st.session_state[f"{cle}_bilan"] = (action, bilan["echec"]), None
+            st.rerun()
+
+def afficher_statut_sauvegarde(nom):
+    statut = file_sauvegarde.statut(nom, st.session_state.session_id) if file_sauvegarde else None
+    if statut is None: return
+    etat, message, heure = statut
+    if etat in ("en_attente", "en_cours"): suivi_sauvegarde(nom)
+    elif etat in ("ok", "fusion"): st.caption(f"☁️ Sauvegardé à {heure[-8:]}")
+    elif etat == "conflit": st.caption("⚠️ Conflit avec une autre session")
+    else:
+        st.error(f"Erreur Cloud: {message}")
+        if st.button("Réessayer"):
+            file_sauvegarde.reessayer(nom, st.session_state.session_id)
+            st.rerun()
+
+def synchroniser_sauvegarde():
+    # Résultat de la dernière écriture de cette session : nouvelle base, fusion ou conflit
+    if file_sauvegarde is None: return
+    res = file_sauvegarde.resultat(st.session_state.current_char_id, st.session_state.session_id)
+    if res is None: return
+    if res["etat"] == "conflit":
+        st.session_state.conflit = res
+        return
+    perso = st.session_state.perso
+    if res["etat"] == "fusion":
+        # Les modifications faites depuis l'envoi restent prioritaires
+        fusion, _ = fusionner(res["soumis"], perso.vers_dict(), res["data"])
+        st.session_state.perso = Perso.depuis_dict(fusion, base=res["data"])
+        reinitialiser_widgets()
+        st.toast("Modifications d'une autre session fusionnées.")
+    # Replié par le journal en tâche de fond : plus rien à sauvegarder
+    else: perso.rebaser(tout=perso.vers_dict() == res["data"])
+    st.session_state.base = (res["rev"], res["data"])
+    rouvrir_journal()
+
+def panneau_perf():
+    # Opt-in (?perf=1) : dernier rerun de la session, puis p50 / p95 de tout le processus
+    with st.sidebar.expander("⏱️ Performances", expanded=True):
+        st.caption("Dernier rerun")
+        st.dataframe(st.session_state.get("perf_trace", []), hide_index=True, use_container_width=True)
+        st.caption("Fenêtre glissante")
+        st.dataframe([{"op": op, **v} for op, v in perf.mesures.stats().items()], hide_index=True, use_container_width=True)
+        octets = perf.mesures.octets_total
+        st.caption(f"API : {dict(perf.mesures.api_total)} · {octets['envoyes']} o envoyés, {octets['recus']} o reçus")
+
+COOKIE_SESSION = "dnd_session"
+
+def est_hex32(texte):
+    return len(texte) == 32 and all(c in "0123456789abcdef" for c in texte)
+
+def poser_cookie(nom, valeur, duree=365 * 86400):
+    # st.context.cookies est en lecture seule : écrit côté navigateur, relu à la prochaine connexion
+    components.html(f"<script>window.parent.document.cookie = '{nom}={valeur}; path=/; max-age={duree}; SameSite=Strict';</script>", height=0)
+
 # --- GESTION ÉTAT ---
 if "db" not in st.session_state:
     with st.spinner('Connexion Cloud...'):
-        st.session_state.db = charger_donnees()
+        st.session_state.db = charger_donnees() or {}
 
 if "current_char_id" not in st.session_state:
     st.session_state.current_char_id = None
-if "unsaved_changes" not in st.session_state:
-    st.session_state.unsaved_changes = False
 if "edit_mode" not in st.session_state:
     st.session_state.edit_mode = {}
+if "session_id" not in st.session_state:
+    # ?s= (propre à l'onglet) est public : un lien partagé le transmet. La clé du
+    # journal et de la file le signe avec un secret du navigateur, gardé en cookie :
+    # ailleurs, le même lien ouvre une autre session
+    sid = st.query_params.get("s", "")
+    if not est_hex32(sid): sid = uuid.uuid4().hex
+    st.query_params["s"] = sid
+    cle_navigateur = st.context.cookies.get(COOKIE_SESSION, "")
+    if not est_hex32(cle_navigateur):
+        cle_navigateur = secrets.token_hex(16)
+        poser_cookie(COOKIE_SESSION, cle_navigateur)
+    st.session_state.session_id = hmac.new(bytes.fromhex(cle_navigateur), sid.encode(), "sha256").hexdigest()[:32]
+if "conflit" not in st.session_state:
+    st.session_state.conflit = None
 
 # --- ACTIONS ---
 def action_sauvegarder():
-    nom = st.session_state.perso["infos"]["nom"]
-    bm = calculer_bm(st.session_state.perso["infos"]["niveau"])
-    for f in st.session_state.perso["features"]:
-        if f.get("linked_pb", False):
-            f["max"] = bm
-            if f["actuel"] > bm: f["actuel"] = bm
-    st.session_state.db[nom] = st.session_state.perso
-    with st.spinner('Sauvegarde...'):
-        sauvegarder_donnees(st.session_state.db)
+    perso = st.session_state.perso
+    nom = perso.infos.nom
+    bm = calculer_bm(perso.infos.niveau)
+    for f in perso.features.values():
+        if f.linked_pb:
+            f.max = bm
+            if f.actuel > bm: f.actuel = bm
+    # Renommé : c'est une nouvelle ligne, qui ne doit pas déjà exister
+    base = st.session_state.base if nom == st.session_state.current_char_id else (0, {})
+    sauvegarder_donnees({nom: perso}, bases={nom: base})
+    # Le journal n'est remis à zéro qu'une fois l'écriture confirmée (synchroniser_sauvegarde)
+    vider_journal()
     st.session_state.current_char_id = nom
-    st.session_state.unsaved_changes = False 
-    st.toast(f"Sauvegarde Cloud réussie ! ☁️")
     st.rerun()
 
 def action_supprimer_perso(nom_a_supprimer):
     if nom_a_supprimer in st.session_state.db:
-        del st.session_state.db[nom_a_supprimer]
-        with st.spinner('Suppression...'):
-            sauvegarder_donnees(st.session_state.db)
-        st.toast(f"{nom_a_supprimer} supprimé.")
+        rev = st.session_state.db.pop(nom_a_supprimer).get("rev", 0)
+        sauvegarder_donnees({}, [nom_a_supprimer], bases={nom_a_supprimer: (rev, None)})
+        # Confirmée (ou refusée) par suivi_ecritures, sur l'accueil
+        if file_sauvegarde is not None:
+            st.session_state.suppression_suivi = ("Suppression", [nom_a_supprimer])
+            st.session_state.suppression_bilan = None
         st.rerun()
 
 def action_quitter_sans_sauver():
+    journal.clore(st.session_state.session_id)
     st.session_state.current_char_id = None
-    st.session_state.unsaved_changes = False
+    st.session_state.conflit = None
+    st.rerun()
+
+def resoudre_conflit(gagnant):
+    res = st.session_state.conflit
+    st.session_state.conflit = None
+    if res["data"] is None:
+        # Supprimé ailleurs : on le recrée, ou on abandonne
+        if gagnant == "theirs": action_quitter_sans_sauver()
+        st.session_state.base = (0, {})
+        action_sauvegarder()
+    fusion, _ = fusionner(res["base"][1], st.session_state.perso.vers_dict(), res["data"], gagnant)
+    st.session_state.perso = Perso.depuis_dict(fusion, base=res["data"])
+    st.session_state.base = (res["rev"], res["data"])
+    rouvrir_journal()
+    reinitialiser_widgets()
+    if gagnant == "mine": action_sauvegarder()
     st.rerun()
 
 # --- MODALES ---
@@ -209,6 +513,20 @@ def dialog_suppression(nom_perso):
     if col1.button("🗑️ Oui", type="primary"): action_supprimer_perso(nom_perso)
     if col2.button("Annuler"): st.rerun()
 
+@st.dialog("Conflit de sauvegarde")
+def dialog_conflit():
+    res = st.session_state.conflit
+    st.warning("Ce personnage a été modifié dans une autre session depuis son ouverture.")
+    for chemin in res["conflits"]:
+        if not chemin:
+            st.write("- Il a été supprimé entre-temps.")
+            continue
+        mine, theirs = st.session_state.perso.valeur(chemin), lire_chemin(res["data"], chemin)
+        st.write(f"- **{' › '.join(map(str, chemin))}** : vous `{mine}` / eux `{theirs}`")
+    col1, col2 = st.columns(2)
+    if col1.button("Garder les miennes", type="primary"): resoudre_conflit("mine")
+    if col2.button("Prendre les leurs"): resoudre_conflit("theirs")
+
 @st.dialog("Quitter sans sauvegarder ?")
 def dialog_confirm_exit():
     st.warning("Modifs non enregistrées.")
@@ -221,25 +539,8 @@ def dialog_repos(type_repos):
     st.write(f"Lancer un repos **{type_repos}** ?")
     col1, col2 = st.columns(2)
     if col1.button("✅ Valider", type="primary"):
-        if type_repos == "Court":
-            for f in st.session_state.perso["features"]:
-                if f["repos"] == "Court": f["actuel"] = f["max"]
-            for i in st.session_state.perso["items"]:
-                if i["repos"] == "Court": i["actuel"] = i["max"]
-            st.toast("Repos court terminé")
-        else:
-            bm = calculer_bm(st.session_state.perso["infos"]["niveau"])
-            for f in st.session_state.perso["features"]: 
-                if f.get("linked_pb", False): f["max"] = bm
-                f["actuel"] = f["max"]
-            for i in st.session_state.perso["items"]: 
-                i["actuel"] = i["max"]
-            for lvl in st.session_state.perso["spells"]:
-                st.session_state.perso["spells"][lvl]["actuel"] = st.session_state.perso["spells"][lvl]["max"]
-            st.session_state.perso["hit_dice_used"] = 0
-            st.session_state.perso["hp"]["actuel"] = st.session_state.perso["hp"]["max"]
-            st.session_state.perso["hp"]["temp"] = 0
-            st.toast("Repos long terminé")
+        appliquer_repos(st.session_state.perso, type_repos)
+        st.toast("Repos court terminé" if type_repos == "Court" else "Repos long terminé")
         st.rerun()
     if col2.button("Annuler"): st.rerun()
 
@@ -256,27 +557,293 @@ def dialog_xp():
     if col2.button("Annuler"):
         st.rerun()
 
+# --- SECTIONS (FRAGMENTS) ---
+# Chaque section se relance seule quand on clique dedans ; le reste de la
+# page (en-tête, niveau, BM, repos) provoque une relance complète.
+def verifier_entete():
+    # Le bouton "Sauvegarder *" est hors fragment : relance complète au premier changement
+    vider_journal()
+    if st.session_state.perso.modifie != st.session_state.get("entete_sale"):
+        st.rerun()
+
+@st.fragment
+@perf.chronometrer("section_pv_dv")
+def section_pv_dv():
+    verifier_entete()
+    zone_pv, zone_dv = st.columns([1.5, 1])
+
+    with zone_pv:
+        with st.container(border=True):
+            st.markdown("### ❤️ Points de Vie")
+            hp1, hp2, hp3 = st.columns(3)
+            with hp1: compteur_propre("Max", ["hp", "max"], 1, 999)
+            with hp2: compteur_propre("Actuel", ["hp", "actuel"], -999, 999)
+            with hp3: compteur_propre("Temp", ["hp", "temp"], 0, 999)
+
+            cur = st.session_state.perso.hp.actuel
+            max_pv = st.session_state.perso.hp.max
+            if max_pv > 0:
+                ratio = float(cur) / float(max_pv)
+                st.progress(max(0.0, min(1.0, ratio)))
+
+    with zone_dv:
+        with st.container(border=True):
+            selected_class = st.session_state.perso.infos.classe
+            die_type = CLASSES_DATA.get(selected_class, "d8")
+            dv_max = st.session_state.perso.infos.niveau
+            dv_used = st.session_state.perso.hit_dice_used
+
+            cdv_titre, cdv_btn = st.columns([1, 1])
+            cdv_titre.markdown(f"### 🎲 ({die_type})")
+
+            dv_restants = dv_max - dv_used
+            st.caption(f"Restants : {dv_restants} / {dv_max}")
+            st.progress(dv_restants / dv_max if dv_max > 0 else 0)
+
+            b_use, b_recup = st.columns(2)
+            b_use.button("Utiliser", on_click=cb_update_dv, args=(1, dv_max), disabled=(dv_used >= dv_max), use_container_width=True)
+            b_recup.button("Récup.", on_click=cb_update_dv, args=(-1, dv_max), disabled=(dv_used <= 0), use_container_width=True)
+
+@st.fragment
+@perf.chronometrer("section_sorts")
+def section_sorts():
+    verifier_entete()
+    actif = st.checkbox("Activer Sorts", value=st.session_state.perso.spells_active)
+    if actif != st.session_state.perso.spells_active:
+        st.session_state.perso.spells_active = actif
+        st.rerun(scope="fragment")
+    if actif:
+        cols = st.columns(3)
+        for lvl in range(1, 10):
+            lvl_str = str(lvl)
+            col_idx = (lvl - 1) % 3
+            with cols[col_idx]:
+                with st.container(border=True):
+                    st.write(f"**Niveau {lvl}**")
+                    emplacement = st.session_state.perso.spells[lvl_str]
+                    new_max = st.number_input("Max", 0, 4, value=emplacement.max, key=f"smx_{lvl}")
+                    emplacement.max = new_max
+                    if emplacement.actuel > new_max:
+                        emplacement.actuel = new_max
+                    curr = emplacement.actuel
+                    display_str = "🟦 " * curr + "⬛ " * (new_max - curr)
+                    st.markdown(f"<div style='font-size: 24px; line-height: 1.5; margin-bottom: 5px;'>{display_str}</div>", unsafe_allow_html=True)
+                    b1, b2 = st.columns(2)
+                    b1.button("Utiliser", key=f"use_{lvl}", on_click=cb_update_spell, args=(lvl_str, -1), disabled=(curr==0))
+                    b2.button("Restaurer", key=f"rest_{lvl}", on_click=cb_update_spell, args=(lvl_str, 1), disabled=(curr==new_max))
+    vider_journal()
+
+@st.fragment
+@perf.chronometrer("section_competences")
+def section_competences():
+    verifier_entete()
+    bm = calculer_bm(st.session_state.perso.infos.niveau)
+    with st.expander("Ajouter Compétence"):
+        c1, c2, c3, c4 = st.columns([3, 1, 1, 1])
+        n_name = c1.text_input("Nom", key="nf_name")
+        link_pb = c2.checkbox("Lier BM", key="nf_link")
+        val_max = bm if link_pb else 1
+        n_max = c2.number_input("Max", 1, 50, val_max, disabled=link_pb, key="nf_max")
+        n_rest = c3.selectbox("Reset", ["Court", "Long"], key="nf_rest")
+        if c4.button("Ajouter", key="nf_add") and n_name:
+            st.session_state.perso.ajouter("features", Entree(
+                nom=n_name, max=n_max, actuel=n_max, repos=n_rest, linked_pb=link_pb
+            ))
+            st.rerun(scope="fragment")
+    feats = st.session_state.perso.entrees("features")
+    visibles, compact = filtrer_et_paginer("feats", feats) if feats else ([], False)
+    for pos, i, feat in visibles:
+        if compact:
+            ligne_compacte("f", i, feat, cb_update_feat)
+            continue
+        with st.container(border=True):
+            if st.session_state.edit_mode.get(f"feat_{i}", False):
+                ec1, ec2, ec3, ec4 = st.columns([3, 1, 1, 1])
+                new_nom = ec1.text_input("Nom", feat.nom, key=f"ed_n_{i}")
+                edit_link = ec2.checkbox("Lier BM", value=bool(feat.linked_pb), key=f"ed_l_{i}")
+                edit_max_val = bm if edit_link else feat.max
+                edit_max = ec2.number_input("Max", 1, 50, edit_max_val, disabled=edit_link, key=f"ed_m_{i}")
+                edit_rest = ec3.selectbox("Reset", ["Court", "Long"], index=0 if feat.repos=="Court" else 1, key=f"ed_r_{i}")
+                if ec4.button("💾", key=f"ed_save_{i}"):
+                    feat.nom = new_nom
+                    feat.linked_pb = edit_link
+                    feat.max = edit_max
+                    feat.repos = edit_rest
+                    st.session_state.edit_mode[f"feat_{i}"] = False
+                    st.rerun(scope="fragment")
+            else:
+                c_main, c_up, c_down = st.columns([10, 1, 1])
+                with c_main:
+                    c1, c_min, c_val, c_plus, c_edit, c_del = st.columns([4, 0.7, 1, 0.7, 0.5, 0.5])
+                    badges = f"({feat.repos})"
+                    if feat.linked_pb: badges += " [BM]"
+                    c1.write(f"**{feat.nom}** {badges}")
+                    if feat.max > 0: c1.progress(feat.actuel / feat.max)
+                    c_min.button("➖", key=f"fm_{i}", on_click=cb_update_feat, args=(i, -1), disabled=(feat.actuel==0))
+                    c_val.write(f"{feat.actuel} / {feat.max}")
+                    c_plus.button("➕", key=f"fp_{i}", on_click=cb_update_feat, args=(i, 1), disabled=(feat.actuel==feat.max))
+                    if c_edit.button("✍️", key=f"edit_btn_{i}"):
+                        st.session_state.edit_mode[f"feat_{i}"] = True
+                        st.rerun(scope="fragment")
+                    if c_del.button("🗑️", key=f"del_feat_{i}"):
+                        supprimer_entree("features", i)
+                        st.rerun(scope="fragment")
+                with c_up:
+                    if pos > 0: st.button("⬆️", key=f"f_up_{i}", on_click=cb_move_item, args=("features", i, -1))
+                with c_down:
+                    if pos < len(feats) - 1: st.button("⬇️", key=f"f_down_{i}", on_click=cb_move_item, args=("features", i, 1))
+
+@st.fragment
+@perf.chronometrer("section_inventaire")
+def section_inventaire():
+    verifier_entete()
+    with st.expander("Ajouter Objet"):
+        c1, c2, c3, c4 = st.columns([3, 1, 1, 1])
+        i_name = c1.text_input("Nom", key="ni_name")
+        i_max = c2.number_input("Charges", 1, 50, 1, key="ni_max")
+        i_rest = c3.selectbox("Reset", ["Court", "Long", "Jamais"], key="ni_rest")
+        if c4.button("Ajouter", key="ni_add") and i_name:
+            st.session_state.perso.ajouter("items", Entree(nom=i_name, max=i_max, actuel=i_max, repos=i_rest))
+            st.rerun(scope="fragment")
+    items = st.session_state.perso.entrees("items")
+    if not items: st.info("Inventaire vide.")
+    visibles, compact = filtrer_et_paginer("items", items) if items else ([], False)
+    for pos, i, item in visibles:
+        if compact:
+            ligne_compacte("i", i, item, cb_update_item)
+            continue
+        with st.container(border=True):
+            c_main, c_up, c_down = st.columns([10, 1, 1])
+            with c_main:
+                c1, c_min, c_val, c_plus, c_del = st.columns([4, 0.7, 1, 0.7, 0.5])
+                c1.write(f"**{item.nom}** ({item.repos})")
+                if item.max > 0: c1.progress(item.actuel / item.max)
+                c_min.button("➖", key=f"im_{i}", on_click=cb_update_item, args=(i, -1), disabled=(item.actuel==0))
+                c_val.write(f"{item.actuel} / {item.max}")
+                c_plus.button("➕", key=f"ip_{i}", on_click=cb_update_item, args=(i, 1), disabled=(item.actuel==item.max))
+                if c_del.button("🗑️", key=f"del_item_{i}"):
+                    supprimer_entree("items", i)
+                    st.rerun(scope="fragment")
+            with c_up:
+                if pos > 0: st.button("⬆️", key=f"i_up_{i}", on_click=cb_move_item, args=("items", i, -1))
+            with c_down:
+                if pos < len(items) - 1: st.button("⬇️", key=f"i_down_{i}", on_click=cb_move_item, args=("items", i, 1))
+
+@st.fragment(run_every=INTERVALLE_SUIVI)
+@perf.chronometrer("liste_heros")
+def liste_heros():
+    # Tableau du MJ : se relit seul, seules les lignes changées ailleurs sont relues
+    db = charger_donnees(INTERVALLE_SUIVI)
+    if db is not None: st.session_state.db = db
+    else:
+        st.error(f"Erreur Cloud: {st.session_state.erreur_roster}")
+        st.button("🔄 Réessayer", key="reessayer_roster")
+    if not st.session_state.db and db is not None: st.info("Aucun personnage.")
+    for p_nom, info_p in st.session_state.db.items():
+        with st.container(border=True):
+            c1, c2, c3 = st.columns([4, 1, 1])
+            c1.markdown(f"**{p_nom}** - {info_p['classe']} {info_p['niveau']} · ❤️ {info_p['pv']}")
+            if c2.button("📂", key=f"load_{p_nom}", help="Charger"):
+                perso, base = charger_perso(p_nom)
+                if perso is not None:
+                    st.session_state.perso, st.session_state.base = perso, base
+                    st.session_state.current_char_id = p_nom
+                    journal.ouvrir(st.session_state.session_id, st.session_state.campagne, p_nom, base)
+                    st.rerun()
+            if c3.button("🗑️", key=f"del_{p_nom}", help="Supprimer"):
+                dialog_suppression(p_nom)
+
+# --- REPRISE APRÈS COUPURE ---
+def reprendre_journal():
+    # Nouvelle session sur un identifiant connu : on rouvre le personnage et on rejoue le journal
+    etat = journal.etat(st.session_state.session_id)
+    if etat is None: return
+    if etat["campagne"] != st.session_state.campagne:
+        st.session_state.campagne = etat["campagne"]
+        st.query_params["campagne"] = etat["campagne"]
+        del st.session_state["journal_relu"]
+        st.rerun()
+    # Une sauvegarde de la session encore en file part déjà de la dernière version connue
+    en_file = file_sauvegarde is not None and file_sauvegarde.lire(etat["nom"], st.session_state.session_id) is not None
+    perso, base = charger_perso(etat["nom"])
+    if backend is None or (perso is None and (etat["base"] is None or not etat["modifs"])):
+        journal.clore(st.session_state.session_id)
+        return
+    ignorees, conflit = 0, None
+    if etat["modifs"]:
+        try:
+            if etat["base"] is None or en_file:
+                data, ignorees = rejouer(perso.vers_dict(), etat["modifs"])
+                perso = Perso.depuis_dict(data, base=base[1])
+            else:
+                # Rejouées sur la version ouverte, puis reportées sur la version stockée
+                # comme une sauvegarde : ce qu'une autre session a écrit entre-temps est gardé
+                ouverte, actuelle = etat["base"], base
+                mine, ignorees = rejouer(copy.deepcopy(ouverte[1]), etat["modifs"])
+                modifs = modifs_finales(mine, etat["modifs"])
+                if actuelle is None: final, conflits = None, [()]
+                elif actuelle[0] == ouverte[0]: final, conflits = mine, []
+                elif modifs is None: final, conflits = fusionner(ouverte[1], mine, actuelle[1])
+                else: final, conflits = appliquer_modifs(ouverte[1], mine, modifs, actuelle[1])
+                if conflits:
+                    conflit = {"etat": "conflit", "rev": actuelle[0] if actuelle else 0,
+                               "data": actuelle[1] if actuelle else None, "conflits": conflits, "base": ouverte}
+                    perso, base = Perso.depuis_dict(mine, base=ouverte[1]), ouverte
+                else: perso = Perso.depuis_dict(final, base=actuelle[1])
+        except Exception:
+            # Journal illisible pour cette version : on ne le rejouera pas à chaque rechargement
+            journal.clore(st.session_state.session_id)
+            st.toast("Modifications non sauvegardées impossibles à restaurer.")
+            return
+    st.session_state.perso, st.session_state.base = perso, base
+    st.session_state.current_char_id = etat["nom"]
+    st.session_state.conflit = conflit
+    # Le journal repart de la base retenue, avec ce qui reste à sauvegarder
+    if conflit is None: rouvrir_journal()
+    else: perso.recents()  # déjà au journal, sur la base ouverte
+    restaurees = len(etat["modifs"]) - ignorees
+    if restaurees: st.toast(f"{restaurees} modification(s) non sauvegardée(s) restaurée(s).")
+    if ignorees: st.toast(f"{ignorees} modification(s) ignorée(s) : supprimé entre-temps.")
+
+if "journal_relu" not in st.session_state:
+    st.session_state.journal_relu = True
+    reprendre_journal()
+
 # ================= INTERFACE =================
 
 if st.session_state.current_char_id is None:
+    cadre_page = perf.mesures.ouvrir("accueil")
     st.title("🐉 D&D Manager")
+    try: campagnes = repertoire.campagnes()
+    except Exception: campagnes = [st.session_state.campagne]
+    if st.session_state.campagne not in campagnes: campagnes.append(st.session_state.campagne)
+    st.selectbox("Campagne", campagnes, index=campagnes.index(st.session_state.campagne),
+                 key="w_campagne", on_change=cb_changer_campagne)
     col_g, col_d = st.columns([1, 1])
     with col_g:
         st.subheader("Héros")
+        liste_heros()
+        if st.session_state.get("suppression_suivi"): suivi_ecritures("suppression")
+        if st.session_state.get("suppression_bilan"): afficher_bilan("suppression")
         liste_persos = list(st.session_state.db.keys())
+
         if liste_persos:
-            for p_nom in liste_persos:
-                with st.container(border=True):
-                    c1, c2, c3 = st.columns([4, 1, 1])
-                    info_p = st.session_state.db[p_nom]['infos']
-                    c1.markdown(f"**{p_nom}** - {info_p['classe']} {info_p['niveau']}")
-                    if c2.button("📂", key=f"load_{p_nom}", help="Charger"):
-                        st.session_state.perso = json.loads(json.dumps(st.session_state.db[p_nom]))
-                        st.session_state.current_char_id = p_nom
-                        st.rerun()
-                    if c3.button("🗑️", key=f"del_{p_nom}", help="Supprimer"):
-                        dialog_suppression(p_nom)
-        else: st.info("Aucun personnage.")
+            with st.expander("🎲 Groupe (MJ)"):
+                groupe = st.multiselect("Personnages", liste_persos, default=liste_persos, key="mj_groupe")
+                choix_action = st.radio("Action", ["Repos Court", "Repos Long", "XP"], horizontal=True, key="mj_action")
+                xp_total, nb_joueurs = 0, 1
+                if choix_action == "XP":
+                    xp_total = st.number_input("XP Totale du groupe", min_value=0, step=100, key="mj_xp_total")
+                    nb_joueurs = st.number_input("Nombre de joueurs", min_value=1, value=max(1, len(groupe)))
+                    st.caption(f"{gain_xp(xp_total, nb_joueurs)} XP chacun")
+                if st.button("Appliquer au groupe", type="primary", disabled=not groupe):
+                    action = {"Repos Court": "Court", "Repos Long": "Long"}.get(choix_action, "XP")
+                    ecrits = action_groupe(groupe, action, xp_total, nb_joueurs)
+                    st.session_state.groupe_suivi = (choix_action, ecrits) if ecrits else None
+                    st.session_state.groupe_bilan = None
+                    st.rerun()
+        if st.session_state.get("groupe_suivi"): suivi_ecritures("groupe")
+        if st.session_state.get("groupe_bilan"): afficher_bilan("groupe")
 
     with col_d:
         st.subheader("Création")
@@ -284,36 +851,58 @@ if st.session_state.current_char_id is None:
         if st.button("Créer ✨", type="primary"):
             if nom_new and nom_new not in st.session_state.db:
                 st.session_state.perso = nouveau_perso_template()
-                st.session_state.perso["infos"]["nom"] = nom_new
+                st.session_state.perso.infos.nom = nom_new
+                st.session_state.base = (0, {})
                 st.session_state.current_char_id = nom_new
                 action_sauvegarder() 
             elif nom_new in st.session_state.db: st.error("Existe déjà !")
 
+        with st.expander("🗺️ Nouvelle campagne"):
+            nom_campagne = st.text_input("Nom de la campagne")
+            if st.button("Créer la campagne") and nom_campagne:
+                try: repertoire.creer(nom_campagne)
+                except ValueError as e: st.error(str(e))
+                except Exception as e: st.error(f"Erreur Cloud: {e}")
+                else:
+                    st.session_state.campagne = nom_campagne.strip()
+                    st.query_params["campagne"] = st.session_state.campagne
+                    st.session_state.pop("w_campagne", None)
+                    st.rerun()
+
+        with st.expander("🛠️ Maintenance"):
+            st.caption("Réécrit toute la feuille au format compact (répare les lignes en double ou illisibles, remplit les colonnes de résumé).")
+            if st.button("Compacter / Réparer"):
+                with st.spinner('Compactage...'):
+                    compacter_donnees()
+                st.toast("Feuille compactée.")
+    perf.mesures.fermer(cadre_page)
+
 else:
-    if "hp" not in st.session_state.perso: st.session_state.perso["hp"] = {"max": 10, "actuel": 10, "temp": 0}
-    if "xp" not in st.session_state.perso: st.session_state.perso["xp"] = 0
+    synchroniser_sauvegarde()
+    if st.session_state.conflit: dialog_conflit()
 
-    c_back, c_empty, c_save = st.columns([1, 4, 1])
+    c_back, c_statut, c_save = st.columns([1, 4, 1])
     if c_back.button("⬅️ Accueil"):
-        if st.session_state.unsaved_changes: dialog_confirm_exit()
+        if st.session_state.perso.modifie: dialog_confirm_exit()
         else: action_quitter_sans_sauver()
+    with c_statut: afficher_statut_sauvegarde(st.session_state.current_char_id)
     
-    btn_label = "Sauvegarder *" if st.session_state.unsaved_changes else "Sauvegarder"
-    btn_type = "primary" if st.session_state.unsaved_changes else "secondary"
+    btn_label = "Sauvegarder *" if st.session_state.perso.modifie else "Sauvegarder"
+    btn_type = "primary" if st.session_state.perso.modifie else "secondary"
     if c_save.button(btn_label, type=btn_type, use_container_width=True): action_sauvegarder()
+    st.session_state.entete_sale = st.session_state.perso.modifie
 
     st.divider()
 
+    cadre_entete = perf.mesures.ouvrir("entete")
     # --- INFOS COMPACTES (V23) ---
     # Nouvelle répartition pour serrer les boulons
     # Nom (1.5) | Race (1) | Classe (1) | Niv (0.8) | XP (1.7) | BM (0.5)
     col1, col2, col3, col4, col5, col6 = st.columns([1.5, 1, 1, 0.8, 1.7, 0.5])
-    def dirty_callback(): make_dirty()
+    st.session_state.perso.infos.nom = col1.text_input("Nom", st.session_state.perso.infos.nom)
+    st.session_state.perso.infos.race = col2.text_input("Race", st.session_state.perso.infos.race)
     
-    st.session_state.perso["infos"]["nom"] = col1.text_input("Nom", st.session_state.perso["infos"]["nom"], on_change=dirty_callback)
-    st.session_state.perso["infos"]["race"] = col2.text_input("Race", st.session_state.perso["infos"]["race"], on_change=dirty_callback)
-    
-    current_class_val = st.session_state.perso["infos"]["classe"]
+    current_class_val = st.session_state.perso.infos.classe
     idx_class = LISTE_CLASSES.index(current_class_val) if current_class_val in LISTE_CLASSES else 0
     col3.selectbox("Classe", LISTE_CLASSES, index=idx_class, key="widget_classe", on_change=cb_change_classe)
 
@@ -321,14 +910,14 @@ else:
     
     # --- SECTION XP ALIGNÉE ---
     with col5:
-        lvl_actuel = st.session_state.perso["infos"]["niveau"]
+        lvl_actuel = st.session_state.perso.infos.niveau
         xp_target = XP_TABLE.get(lvl_actuel, "MAX")
         
         # On divise la colonne XP en deux sous-blocs serrés : [Input XP (80%)] [Bouton (20%)]
         cx_in, cx_btn = st.columns([4, 1])
         
         with cx_in:
-            st.number_input(f"XP (Palier: {xp_target})", value=st.session_state.perso["xp"], 
+            st.number_input(f"XP (Palier: {xp_target})", value=st.session_state.perso.xp, 
                             key="widget_xp_val", on_change=cb_xp_input)
         with cx_btn:
             # Astuce pour aligner le bouton avec l'input (car le label prend de la place)
@@ -339,41 +928,10 @@ else:
 
     bm = calculer_bm(lvl_actuel)
     col6.metric("BM", f"+{bm}")
+    perf.mesures.fermer(cadre_entete)
 
     # --- LAYOUT COMPACT (PV & DV) ---
-    zone_pv, zone_dv = st.columns([1.5, 1]) 
-
-    with zone_pv:
-        with st.container(border=True):
-            st.markdown("### ❤️ Points de Vie")
-            hp1, hp2, hp3 = st.columns(3)
-            with hp1: compteur_propre("Max", ["hp", "max"], 1, 999)
-            with hp2: compteur_propre("Actuel", ["hp", "actuel"], -999, 999)
-            with hp3: compteur_propre("Temp", ["hp", "temp"], 0, 999)
-
-            cur = st.session_state.perso["hp"]["actuel"]
-            max_pv = st.session_state.perso["hp"]["max"]
-            if max_pv > 0:
-                ratio = float(cur) / float(max_pv)
-                st.progress(max(0.0, min(1.0, ratio)))
-
-    with zone_dv:
-        with st.container(border=True):
-            selected_class = st.session_state.perso["infos"]["classe"]
-            die_type = CLASSES_DATA.get(selected_class, "d8")
-            dv_max = st.session_state.perso["infos"]["niveau"]
-            dv_used = st.session_state.perso.get("hit_dice_used", 0)
-            
-            cdv_titre, cdv_btn = st.columns([1, 1])
-            cdv_titre.markdown(f"### 🎲 ({die_type})")
-            
-            dv_restants = dv_max - dv_used
-            st.caption(f"Restants : {dv_restants} / {dv_max}")
-            st.progress(dv_restants / dv_max if dv_max > 0 else 0)
-            
-            b_use, b_recup = st.columns(2)
-            b_use.button("Utiliser", on_click=cb_update_dv, args=(1, dv_max), disabled=(dv_used >= dv_max), use_container_width=True)
-            b_recup.button("Récup.", on_click=cb_update_dv, args=(-1, dv_max), disabled=(dv_used <= 0), use_container_width=True)
+    section_pv_dv()
 
     c_rest1, c_rest2 = st.columns(2)
     if c_rest1.button("🍎 Repos Court", use_container_width=True): dialog_repos("Court")
@@ -383,115 +941,13 @@ else:
     
     tab_spells, tab_feats, tab_items = st.tabs(["🔮 Sorts", "⚔️ Compétences", "🎒 Inventaire"])
 
-    with tab_spells:
-        actif = st.checkbox("Activer Sorts", value=st.session_state.perso["spells_active"])
-        if actif != st.session_state.perso["spells_active"]:
-            st.session_state.perso["spells_active"] = actif
-            make_dirty()
-            st.rerun()
-        if actif:
-            cols = st.columns(3)
-            for lvl in range(1, 10):
-                lvl_str = str(lvl)
-                col_idx = (lvl - 1) % 3
-                with cols[col_idx]:
-                    with st.container(border=True):
-                        st.write(f"**Niveau {lvl}**")
-                        old_max = st.session_state.perso["spells"][lvl_str]["max"]
-                        def on_change_max_spell(): make_dirty()
-                        new_max = st.number_input("Max", 0, 4, value=old_max, key=f"smx_{lvl}", on_change=on_change_max_spell)
-                        st.session_state.perso["spells"][lvl_str]["max"] = new_max
-                        if st.session_state.perso["spells"][lvl_str]["actuel"] > new_max:
-                            st.session_state.perso["spells"][lvl_str]["actuel"] = new_max
-                        curr = st.session_state.perso["spells"][lvl_str]["actuel"]
-                        display_str = "🟦 " * curr + "⬛ " * (new_max - curr)
-                        st.markdown(f"<div style='font-size: 24px; line-height: 1.5; margin-bottom: 5px;'>{display_str}</div>", unsafe_allow_html=True)
-                        b1, b2 = st.columns(2)
-                        b1.button("Utiliser", key=f"use_{lvl}", on_click=cb_update_spell, args=(lvl_str, -1), disabled=(curr==0))
-                        b2.button("Restaurer", key=f"rest_{lvl}", on_click=cb_update_spell, args=(lvl_str, 1), disabled=(curr==new_max))
-
-    with tab_feats:
-        with st.expander("Ajouter Compétence"):
-            c1, c2, c3, c4 = st.columns([3, 1, 1, 1])
-            n_name = c1.text_input("Nom", key="nf_name")
-            link_pb = c2.checkbox("Lier BM", key="nf_link")
-            val_max = bm if link_pb else 1
-            n_max = c2.number_input("Max", 1, 50, val_max, disabled=link_pb, key="nf_max")
-            n_rest = c3.selectbox("Reset", ["Court", "Long"], key="nf_rest")
-            if c4.button("Ajouter", key="nf_add") and n_name:
-                st.session_state.perso["features"].append({
-                    "nom": n_name, "max": n_max, "actuel": n_max, "repos": n_rest, "linked_pb": link_pb
-                })
-                make_dirty()
-                st.rerun()
-        feats = st.session_state.perso["features"]
-        for i, feat in enumerate(feats):
-            with st.container(border=True):
-                if st.session_state.edit_mode.get(f"feat_{i}", False):
-                    ec1, ec2, ec3, ec4 = st.columns([3, 1, 1, 1])
-                    new_nom = ec1.text_input("Nom", feat["nom"], key=f"ed_n_{i}")
-                    edit_link = ec2.checkbox("Lier BM", value=feat.get("linked_pb", False), key=f"ed_l_{i}")
-                    edit_max_val = bm if edit_link else feat["max"]
-                    edit_max = ec2.number_input("Max", 1, 50, edit_max_val, disabled=edit_link, key=f"ed_m_{i}")
-                    edit_rest = ec3.selectbox("Reset", ["Court", "Long"], index=0 if feat["repos"]=="Court" else 1, key=f"ed_r_{i}")
-                    if ec4.button("💾", key=f"ed_save_{i}"):
-                        feat["nom"] = new_nom
-                        feat["linked_pb"] = edit_link
-                        feat["max"] = edit_max
-                        feat["repos"] = edit_rest
-                        st.session_state.edit_mode[f"feat_{i}"] = False
-                        make_dirty()
-                        st.rerun()
-                else:
-                    c_main, c_up, c_down = st.columns([10, 1, 1])
-                    with c_main:
-                        c1, c_min, c_val, c_plus, c_edit, c_del = st.columns([4, 0.7, 1, 0.7, 0.5, 0.5])
-                        badges = f"({feat['repos']})"
-                        if feat.get("linked_pb"): badges += " [BM]"
-                        c1.write(f"**{feat['nom']}** {badges}")
-                        if feat['max'] > 0: c1.progress(feat['actuel'] / feat['max'])
-                        c_min.button("➖", key=f"fm_{i}", on_click=cb_update_feat, args=(i, -1), disabled=(feat['actuel']==0))
-                        c_val.write(f"{feat['actuel']} / {feat['max']}")
-                        c_plus.button("➕", key=f"fp_{i}", on_click=cb_update_feat, args=(i, 1), disabled=(feat['actuel']==feat['max']))
-                        if c_edit.button("✍️", key=f"edit_btn_{i}"):
-                            st.session_state.edit_mode[f"feat_{i}"] = True
-                            st.rerun()
-                        if c_del.button("🗑️", key=f"del_feat_{i}"):
-                            st.session_state.perso["features"].pop(i)
-                            make_dirty()
-                            st.rerun()
-                    with c_up:
-                        if i > 0: st.button("⬆️", key=f"f_up_{i}", on_click=cb_move_item, args=("features", i, -1))
-                    with c_down:
-                        if i < len(feats) - 1: st.button("⬇️", key=f"f_down_{i}", on_click=cb_move_item, args=("features", i, 1))
-
-    with tab_items:
-        with st.expander("Ajouter Objet"):
-            c1, c2, c3, c4 = st.columns([3, 1, 1, 1])
-            i_name = c1.text_input("Nom", key="ni_name")
-            i_max = c2.number_input("Charges", 1, 50, 1, key="ni_max")
-            i_rest = c3.selectbox("Reset", ["Court", "Long", "Jamais"], key="ni_rest")
-            if c4.button("Ajouter", key="ni_add") and i_name:
-                st.session_state.perso["items"].append({"nom": i_name, "max": i_max, "actuel": i_max, "repos": i_rest})
-                make_dirty()
-                st.rerun()
-        items = st.session_state.perso["items"]
-        if not items: st.info("Inventaire vide.")
-        for i, item in enumerate(items):
-            with st.container(border=True):
-                c_main, c_up, c_down = st.columns([10, 1, 1])
-                with c_main:
-                    c1, c_min, c_val, c_plus, c_del = st.columns([4, 0.7, 1, 0.7, 0.5])
-                    c1.write(f"**{item['nom']}** ({item['repos']})")
-                    if item['max'] > 0: c1.progress(item['actuel'] / item['max'])
-                    c_min.button("➖", key=f"im_{i}", on_click=cb_update_item, args=(i, -1), disabled=(item['actuel']==0))
-                    c_val.write(f"{item['actuel']} / {item['max']}")
-                    c_plus.button("➕", key=f"ip_{i}", on_click=cb_update_item, args=(i, 1), disabled=(item['actuel']==item['max']))
-                    if c_del.button("🗑️", key=f"del_item_{i}"):
-                        st.session_state.perso["items"].pop(i)
-                        make_dirty()
-                        st.rerun()
-                with c_up:
-                    if i > 0: st.button("⬆️", key=f"i_up_{i}", on_click=cb_move_item, args=("items", i, -1))
-                with c_down:
-                    if i < len(items) - 1: st.button("⬇️", key=f"i_down_{i}", on_click=cb_move_item, args=("items", i, 1))
\ No newline at end of file
+    with tab_spells: section_sorts()
+    with tab_feats: section_competences()
+    with tab_items: section_inventaire()
+
+vider_journal()
+
+# --- MESURES ---
+perf.mesures.fermer(cadre_script)
+st.session_state.perf_trace = list(perf.mesures.trace)
+if st.query_params.get("perf") == "1": panneau_perf()
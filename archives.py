@@ -0,0 +1,205 @@
+"""Export / import JSONL et instantanés incrémentaux du roster.
+
+    python archives.py exporter roster.jsonl
+    python archives.py importer roster.jsonl --backend sqlite --chemin copie.db
+    python archives.py exporter - | python archives.py importer - --backend sqlite
+    python archives.py instantane sauvegardes/        # à planifier (cron, toutes les 15 min...)
+    python archives.py restaurer sauvegardes/ [--jusqua 20261017-120000]
+
+Une ligne JSON par personnage : {"nom", "rev", "maj", "data"} ; dans un
+instantané, une suppression s'écrit {"nom", "supprime": true}. Lecture et
+écriture se font par lots de --lot personnages (un appel de stockage par
+lot) : rien n'est gardé en mémoire au-delà d'un lot.
+
+instantane ne relit que l'index (colonnes de résumé), puis les seuls
+personnages dont la ligne a changé (REV, MAJ) depuis l'instantané
+précédent ; `etat.json` garde ces signatures. Un instantané complet est
+pris au premier passage puis tous les COMPLET_TOUS, pour que restaurer
+n'ait jamais à relire une longue chaîne : restaurer part du plus récent,
+garde la première version vue de chaque personnage et s'arrête au
+dernier instantané complet. Les personnages de la cible absents de
+cette chaîne (créés depuis) sont supprimés : la cible revient exactement
+à l'état de l'instantané. Sans instantané complet au bout de la chaîne
+(dossier vide ou mal nommé, --jusqua trop ancien, complet effacé), rien
+n'est touché.
+
+Stockage : même configuration que l'app ([stockage] et
+[gcp_service_account] de .streamlit/secrets.toml, DND_BACKEND,
+DND_SQLITE, service_account.json), surchargeable en ligne de commande.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tomllib
+from pathlib import Path
+
+from connexion import ouvrir_repertoire
+from stockage import Repertoire, horodatage
+
+LOT = 100
+COMPLET_TOUS = 96  # instantanés incrémentaux entre deux complets
+
+
+def lire_secrets(chemin=".streamlit/secrets.toml"):
+    try: secrets = tomllib.loads(Path(chemin).read_text(encoding="utf-8"))
+    except (OSError, tomllib.TOMLDecodeError): secrets = {}
+    conf = dict(secrets.get("stockage", {}))
+    if os.environ.get("DND_BACKEND"): conf["backend"] = os.environ["DND_BACKEND"]
+    if os.environ.get("DND_SQLITE"): conf["chemin"] = os.environ["DND_SQLITE"]
+    compte = Path("service_account.json") if Path("service_account.json").is_file() else secrets.get("gcp_service_account")
+    return conf, compte
+
+
+def ouvrir_backend(args):
+    conf, compte = lire_secrets()
+    if args.backend: conf["backend"] = args.backend
+    if args.chemin: conf["chemin"] = args.chemin
+    return ouvrir_repertoire(conf, compte).backend(args.campagne)
+
+
+def _par_lots(iterable, taille):
+    lot = []
+    for x in iterable:
+        lot.append(x)
+        if len(lot) >= taille:
+            yield lot
+            lot = []
+    if lot: yield lot
+
+
+def _ligne(objet):
+    return json.dumps(objet, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+def exporter(backend, sortie, noms=None, lot=LOT):
+    """Écrit les personnages (tous, ou `noms`) dans le flux `sortie` ; renvoie le nombre écrit."""
+    index = backend.charger_index()
+    n = 0
+    for noms_lot in _par_lots(index if noms is None else noms, lot):
+        for nom, (data, rev) in backend.charger_persos(noms_lot, garder=False).items():
+            if data is None: continue  # ligne illisible
+            sortie.write(_ligne({"nom": nom, "rev": rev, "maj": index[nom].get("maj", ""), "data": data}))
+            n += 1
+    return n
+
+
+def _lignes(entree):
+    for ligne in entree:
+        if ligne.strip(): yield json.loads(ligne)
+
+
+def importer(backend, lignes, lot=LOT):
+    """Écritures inconditionnelles par lots ; renvoie (écrits, supprimés)."""
+    ecrits = supprimes = 0
+    for paquet in _par_lots(lignes, lot):
+        modifies = {l["nom"]: l["data"] for l in paquet if not l.get("supprime")}
+        suppr = [l["nom"] for l in paquet if l.get("supprime")]
+        backend.appliquer(modifies, suppr)
+        ecrits, supprimes = ecrits + len(modifies), supprimes + len(suppr)
+    return ecrits, supprimes
+
+
+def instantane(backend, dossier, complet=False, lot=LOT):
+    """Instantané des personnages changés depuis le précédent ; renvoie son chemin (None : rien à faire)."""
+    dossier = Path(dossier)
+    dossier.mkdir(parents=True, exist_ok=True)
+    chemin_etat = dossier / "etat.json"
+    try: etat = json.loads(chemin_etat.read_text(encoding="utf-8"))
+    except (OSError, ValueError): etat = {}
+    complet = complet or "signatures" not in etat or etat.get("depuis_complet", 0) >= COMPLET_TOUS
+    anciennes = {} if complet else etat["signatures"]
+    index = backend.charger_index()
+    # Signature d'une ligne : révision + heure d'écriture (une ligne recréée repart à REV 1)
+    signatures = {nom: f"{res.get('rev', 0)}|{res.get('maj', '')}" for nom, res in index.items()}
+    changes = [nom for nom, sig in signatures.items() if anciennes.get(nom) != sig]
+    supprimes = [nom for nom in anciennes if nom not in signatures]
+    if not complet and not changes and not supprimes: return None
+    while True:
+        nom_fichier = time.strftime("%Y%m%d-%H%M%S") + ("-complet" if complet else "") + ".jsonl"
+        chemin = dossier / nom_fichier
+        if not any(dossier.glob(nom_fichier[:15] + "*.jsonl")): break
+        time.sleep(1)  # un instantané par seconde au plus : les noms font l'ordre
+    provisoire = chemin.with_suffix(".tmp")
+    with open(provisoire, "w", encoding="utf-8") as f:
+        exporter(backend, f, changes, lot)
+        for nom in supprimes: f.write(_ligne({"nom": nom, "supprime": True}))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(provisoire, chemin)  # un instantané interrompu n'est jamais pris pour un bon
+    etat = {"signatures": signatures, "dernier": nom_fichier, "maj": horodatage(),
+            "depuis_complet": 0 if complet else etat.get("depuis_complet", 0) + 1}
+    provisoire = chemin_etat.with_suffix(".tmp")
+    provisoire.write_text(json.dumps(etat, ensure_ascii=False), encoding="utf-8")
+    os.replace(provisoire, chemin_etat)
+    return chemin
+
+
+class ChaineIncomplete(Exception):
+    pass
+
+
+def chaine(dossier, jusqua=None):
+    """Instantanés à relire pour restaurer, du plus récent au dernier complet inclus.
+
+    Lève ChaineIncomplete si aucun instantané complet ne termine la chaîne.
+    """
+    fichiers = sorted(Path(dossier).glob("*.jsonl"), reverse=True)
+    if jusqua: fichiers = [f for f in fichiers if f.stem[:15] <= jusqua]
+    for k, f in enumerate(fichiers):
+        if f.stem.endswith("-complet"): return fichiers[:k + 1]
+    raise ChaineIncomplete(f"aucun instantané complet dans {dossier}" + (f" jusqu'à {jusqua}" if jusqua else ""))
+
+
+def restaurer(backend, dossier, jusqua=None, lot=LOT):
+    """Ramène la cible à l'état de l'instantané choisi (absents supprimés) ; renvoie (écrits, supprimés)."""
+    fichiers = chaine(dossier, jusqua)  # avant toute écriture
+    vus = set()
+    def dernieres_versions():
+        for f in fichiers:
+            with open(f, encoding="utf-8") as entree:
+                for ligne in _lignes(entree):
+                    if ligne["nom"] in vus: continue  # une version plus récente est déjà écrite
+                    vus.add(ligne["nom"])
+                    yield ligne
+    ecrits, supprimes = importer(backend, dernieres_versions(), lot)
+    # Absents de toute la chaîne : créés après l'instantané
+    en_trop = [nom for nom in backend.charger_index(0) if nom not in vus]
+    for noms in _par_lots(en_trop, lot): backend.appliquer({}, noms)
+    return ecrits, supprimes + len(en_trop)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("commande", choices=["exporter", "importer", "instantane", "restaurer"])
+    parser.add_argument("cible", help="fichier JSONL (- : flux standard) ou dossier d'instantanés")
+    parser.add_argument("--backend", choices=["sheets", "sqlite", "memoire"])
+    parser.add_argument("--chemin", help="fichier SQLite")
+    parser.add_argument("--campagne", default=Repertoire.DEFAUT)
+    parser.add_argument("--lot", type=int, default=LOT, help="personnages par appel de stockage")
+    parser.add_argument("--complet", action="store_true", help="instantané complet")
+    parser.add_argument("--jusqua", help="restaurer l'état à cette date (AAAAMMJJ-HHMMSS) ; les personnages créés depuis sont supprimés")
+    args = parser.parse_args()
+    backend = ouvrir_backend(args)
+
+    if args.commande == "exporter":
+        sortie = sys.stdout if args.cible == "-" else open(args.cible, "w", encoding="utf-8")
+        n = exporter(backend, sortie, lot=args.lot)
+        if sortie is not sys.stdout: sortie.close()
+        print(f"{n} personnage(s) exporté(s)", file=sys.stderr)
+    elif args.commande == "importer":
+        entree = sys.stdin if args.cible == "-" else open(args.cible, encoding="utf-8")
+        ecrits, supprimes = importer(backend, _lignes(entree), args.lot)
+        print(f"{ecrits} écrit(s), {supprimes} supprimé(s)", file=sys.stderr)
+    elif args.commande == "instantane":
+        chemin = instantane(backend, args.cible, args.complet, args.lot)
+        print(chemin or "Rien de changé depuis le dernier instantané.", file=sys.stderr)
+    else:
+        try: ecrits, supprimes = restaurer(backend, args.cible, args.jusqua, args.lot)
+        except ChaineIncomplete as e: sys.exit(f"Restauration refusée : {e}")
+        print(f"{ecrits} restauré(s), {supprimes} supprimé(s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Benchmarks headless de app.py : AppTest + faux Google Sheets.
+
+    python bench/bench_app.py --persos 10,100 --entrees 20,300 --latence 0.1
+
+Pour chaque roster synthétique (N personnages x M compétences et M objets)
+on chronomètre les parcours clés : chargement à froid, nouvelle session
+(cache chaud), ouverture d'un personnage, clic sur un compteur, repos
+court / long, sauvegarde (clic puis écriture effective). Chaque mesure est
+une ligne JSON (durée, appels API par méthode, octets) sur la sortie
+standard et, avec --sortie, dans un fichier.
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+RACINE = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RACINE))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+import faux_sheet
+from encodage import encoder
+from stockage import COLONNES_RESUME, EN_TETE, resume
+
+
+def perso_synthetique(i, m):
+    return {
+        "infos": {"nom": f"Héros {i}", "race": "Humain", "classe": "Guerrier", "niveau": 1 + i % 20},
+        "xp": 100 * i,
+        "hp": {"max": 40, "actuel": 25, "temp": 0},
+        "hit_dice_used": 0,
+        "features": [{"nom": f"Compétence {j}", "max": 3, "actuel": 2, "repos": "Court" if j % 2 else "Long",
+                      "linked_pb": False} for j in range(m)],
+        "items": [{"nom": f"Objet {j}", "max": 2, "actuel": 1, "repos": "Long"} for j in range(m)],
+        "spells_active": True,
+        "spells": {str(n): {"max": 2, "actuel": 1} for n in range(1, 10)},
+    }
+
+
+def roster(n, m):
+    lignes = [EN_TETE]
+    for i in range(n):
+        p = perso_synthetique(i, m)
+        res = resume(p)
+        lignes.append([p["infos"]["nom"], encoder(p)] + [res[c] for c in COLONNES_RESUME])
+    return lignes
+
+
+def nouvelle_session():
+    at = AppTest.from_file(str(RACINE / "app.py"), default_timeout=120)
+    at.secrets["gcp_service_account"] = {"type": "service_account"}
+    return at
+
+
+def bouton(at, label=None, key=None):
+    if key is not None: return at.button(key=key)
+    return next(b for b in at.button if b.label == label)
+
+
+def mesurer(etape, ss, fn, contexte):
+    ss.compteur.reinitialiser()
+    t0 = time.perf_counter()
+    erreur = None
+    try: fn()
+    except Exception as e: erreur = f"{type(e).__name__}: {e}"
+    ligne = {**contexte, "etape": etape, "ms": round((time.perf_counter() - t0) * 1000, 2),
+             **ss.compteur.resume()}
+    if erreur: ligne["erreur"] = erreur
+    return ligne
+
+
+def attendre_ecriture(ss, timeout=30):
+    t0 = time.monotonic()
+    while not ss.compteur.appels["batch_update"]:
+        if time.monotonic() - t0 > timeout: raise TimeoutError("aucune écriture")
+        time.sleep(0.005)
+
+
+def scenario(n, m, latence):
+    ss = faux_sheet.FauxSpreadsheet(roster(n, m), latence=latence)
+    faux_sheet.installer(ss)
+    st.cache_resource.clear()  # vrai démarrage à froid : connexion et cache partagés à refaire
+    ctx = {"persos": n, "entrees": m, "latence_s": latence}
+    cible = perso_synthetique(0, m)["infos"]["nom"]
+    resultats = []
+
+    at = nouvelle_session()
+    resultats.append(mesurer("chargement_froid", ss, at.run, ctx))
+    resultats.append(mesurer("nouvelle_session", ss, nouvelle_session().run, ctx))
+    resultats.append(mesurer("ouverture_perso", ss, lambda: bouton(at, key=f"load_{cible}").click().run(), ctx))
+    if m:
+        resultats.append(mesurer("clic_compteur", ss, lambda: bouton(at, key="fm_0").click().run(), ctx))
+    for etape, label in (("repos_court", "🍎 Repos Court"), ("repos_long", "💤 Repos Long")):
+        def repos():
+            bouton(at, label=label).click().run()
+            bouton(at, label="✅ Valider").click().run()
+        resultats.append(mesurer(etape, ss, repos, ctx))
+
+    def sauvegarde():
+        libelle = next(b.label for b in at.button if b.label.startswith("Sauvegarder"))
+        bouton(at, label=libelle).click().run()
+    resultats.append(mesurer("sauvegarde_clic", ss, sauvegarde, ctx))
+    resultats.append(mesurer("sauvegarde_ecrite", ss, lambda: attendre_ecriture(ss), ctx))
+    for ligne in resultats:
+        if at.exception: ligne.setdefault("erreur", str(at.exception[0].message))
+    return resultats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--persos", default="5,50", help="tailles de roster, séparées par des virgules")
+    parser.add_argument("--entrees", default="10,200", help="compétences / objets par personnage")
+    parser.add_argument("--latence", type=float, default=0.0, help="latence simulée par appel API (s)")
+    parser.add_argument("--sortie", help="fichier JSONL de résultats")
+    args = parser.parse_args()
+
+    sortie = open(args.sortie, "w", encoding="utf-8") if args.sortie else None
+    for n in (int(x) for x in args.persos.split(",")):
+        for m in (int(x) for x in args.entrees.split(",")):
+            for ligne in scenario(n, m, args.latence):
+                texte = json.dumps(ligne, ensure_ascii=False)
+                print(texte, flush=True)
+                if sortie: sortie.write(texte + "\n")
+    if sortie: sortie.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""Faux Google Sheets en mémoire pour les benchmarks.
+
+Imite la petite partie de gspread utilisée par l'app (worksheet,
+batch_get, acell, batch_update...) et compte les appels API et les
+octets échangés. installer() remplace gspread / google-auth dans
+sys.modules : app.py tourne alors sans réseau ni identifiants.
+"""
+import json
+import re
+import sys
+import time
+import types
+from collections import Counter
+
+
+class Compteur:
+    def __init__(self):
+        self.reinitialiser()
+
+    def reinitialiser(self):
+        self.appels = Counter()
+        self.octets_envoyes = 0
+        self.octets_recus = 0
+
+    def noter(self, methode, envoye=None, recu=None):
+        self.appels[methode] += 1
+        if envoye is not None: self.octets_envoyes += len(json.dumps(envoye, ensure_ascii=False).encode("utf-8"))
+        if recu is not None: self.octets_recus += len(json.dumps(recu, ensure_ascii=False).encode("utf-8"))
+
+    def resume(self):
+        return {"appels": dict(self.appels), "total_appels": sum(self.appels.values()),
+                "octets_envoyes": self.octets_envoyes, "octets_recus": self.octets_recus}
+
+
+def _col(lettres):
+    n = 0
+    for c in lettres: n = n * 26 + ord(c) - 64
+    return n - 1
+
+
+def _plage(a1):
+    """'B12', 'A:A', 'C2:G' -> (col1, ligne1, col2, ligne2) indices 0, ligne2 None = jusqu'au bout."""
+    m = re.fullmatch(r"([A-Z]+)(\d*)(?::([A-Z]+)(\d*))?", a1)
+    c1, l1, c2, l2 = m.groups()
+    ligne1 = int(l1) - 1 if l1 else 0
+    if c2 is None: return _col(c1), ligne1, _col(c1), ligne1
+    return _col(c1), ligne1, _col(c2), (int(l2) - 1 if l2 else None)
+
+
+def _rogner(lignes):
+    # Comme l'API : cellules vides en fin de ligne et lignes vides en fin de plage omises
+    out = []
+    for row in lignes:
+        while row and row[-1] == "": row = row[:-1]
+        out.append(row)
+    while out and not out[-1]: out.pop()
+    return out
+
+
+class FauxCellule:
+    def __init__(self, valeur):
+        self.value = valeur
+
+
+class FauxWorksheet:
+    def __init__(self, spreadsheet, titre, id_, lignes=None):
+        self.spreadsheet = spreadsheet
+        self.title = titre
+        self.id = id_
+        self.lignes = [[str(v) for v in row] for row in (lignes or [])]
+
+    @property
+    def _compteur(self):
+        return self.spreadsheet.compteur
+
+    def _lire(self, a1):
+        c1, l1, c2, l2 = _plage(a1)
+        bloc = self.lignes[l1:None if l2 is None else l2 + 1]
+        return _rogner([(row + [""] * (c2 + 1))[c1:c2 + 1] for row in bloc])
+
+    def get_all_values(self):
+        self.spreadsheet.attendre()
+        res = [list(row) for row in self.lignes]
+        self._compteur.noter("get_all_values", recu=res)
+        return res
+
+    def batch_get(self, plages):
+        self.spreadsheet.attendre()
+        res = [self._lire(a1) for a1 in plages]
+        self._compteur.noter("batch_get", envoye=plages, recu=res)
+        return res
+
+    def get(self, a1):
+        self.spreadsheet.attendre()
+        res = self._lire(a1)
+        self._compteur.noter("get", envoye=a1, recu=res)
+        return res
+
+    def acell(self, a1):
+        self.spreadsheet.attendre()
+        res = self._lire(a1)
+        valeur = res[0][0] if res and res[0] else None
+        self._compteur.noter("acell", envoye=a1, recu=valeur)
+        return FauxCellule(valeur)
+
+    def clear(self):
+        self.spreadsheet.attendre()
+        self._compteur.noter("clear")
+        self.lignes = []
+
+    def update(self, lignes, *args, **kwargs):
+        self.spreadsheet.attendre()
+        self._compteur.noter("update", envoye=lignes)
+        self.lignes = [[str(v) for v in row] for row in lignes]
+
+
+class FauxSpreadsheet:
+    def __init__(self, lignes=None, latence=0.0):
+        self.compteur = Compteur()
+        self.latence = latence   # simule l'aller-retour réseau de chaque appel
+        self.feuilles = [FauxWorksheet(self, "Feuille 1", 0, lignes)]
+
+    def attendre(self):
+        if self.latence: time.sleep(self.latence)
+
+    @property
+    def sheet1(self):
+        return self.feuilles[0]
+
+    def worksheet(self, titre):
+        self.attendre()
+        self.compteur.noter("worksheet")
+        for f in self.feuilles:
+            if f.title == titre: return f
+        raise LookupError(titre)
+
+    def add_worksheet(self, titre, rows=1, cols=1):
+        self.attendre()
+        self.compteur.noter("add_worksheet")
+        f = FauxWorksheet(self, titre, len(self.feuilles))
+        self.feuilles.append(f)
+        return f
+
+    def values_batch_get(self, plages):
+        self.attendre()
+        res = {"valueRanges": []}
+        for plage in plages:
+            titre, a1 = re.fullmatch(r"'((?:[^']|'')*)'!(.+)", plage).groups()
+            valeurs = next(f for f in self.feuilles if f.title == titre.replace("''", "'"))._lire(a1)
+            res["valueRanges"].append({"range": plage, **({"values": valeurs} if valeurs else {})})
+        self.compteur.noter("values_batch_get", envoye=plages, recu=res)
+        return res
+
+    def _feuille(self, sheet_id):
+        return next(f for f in self.feuilles if f.id == sheet_id)
+
+    def batch_update(self, corps):
+        self.attendre()
+        self.compteur.noter("batch_update", envoye=corps)
+        for requete in corps["requests"]:
+            (type_req, r), = requete.items()
+            if type_req == "updateCells":
+                p = r["range"]
+                f = self._feuille(p["sheetId"])
+                for k, row in enumerate(r["rows"]):
+                    i = p["startRowIndex"] + k
+                    while len(f.lignes) <= i: f.lignes.append([])
+                    valeurs = [c["userEnteredValue"]["stringValue"] for c in row["values"]]
+                    cible = f.lignes[i] + [""] * (p["endColumnIndex"] - len(f.lignes[i]))
+                    cible[p["startColumnIndex"]:p["startColumnIndex"] + len(valeurs)] = valeurs
+                    f.lignes[i] = cible
+            elif type_req == "deleteDimension":
+                p = r["range"]
+                del self._feuille(p["sheetId"]).lignes[p["startIndex"]:p["endIndex"]]
+            elif type_req == "appendCells":
+                f = self._feuille(r["sheetId"])
+                f.lignes = _rogner(f.lignes)
+                for row in r["rows"]:
+                    f.lignes.append([c["userEnteredValue"]["stringValue"] for c in row["values"]])
+            else:
+                raise NotImplementedError(type_req)
+        return {}
+
+
+class FauxClient:
+    def __init__(self, spreadsheet):
+        self.spreadsheet = spreadsheet
+
+    def open(self, nom):
+        self.spreadsheet.attendre()
+        self.spreadsheet.compteur.noter("open")
+        return self.spreadsheet
+
+
+def installer(spreadsheet):
+    """Remplace gspread et google-auth par des faux branchés sur `spreadsheet`."""
+    gspread = types.ModuleType("gspread")
+    gspread.authorize = lambda creds: FauxClient(spreadsheet)
+    oauth2 = types.ModuleType("google.oauth2")
+    service_account = types.ModuleType("google.oauth2.service_account")
+
+    class Credentials:
+        token, expiry = None, None
+        @classmethod
+        def from_service_account_info(cls, info, scopes=None): return cls()
+        @classmethod
+        def from_service_account_file(cls, nom, scopes=None): return cls()
+
+    service_account.Credentials = Credentials
+    oauth2.service_account = service_account
+    # google est un espace de noms partagé (protobuf de streamlit...) : on ne le remplace pas
+    try: import google
+    except ImportError: sys.modules["google"] = types.ModuleType("google")
+    sys.modules.update({"gspread": gspread, "google.oauth2": oauth2,
+                        "google.oauth2.service_account": service_account})
@@ -0,0 +1,107 @@
+"""Ouverture du stockage au démarrage, en tâche de fond.
+
+gspread et google-auth ne sont importés qu'au moment de se connecter à
+Google Sheets : les backends locaux et l'affichage de la page ne les
+attendent pas. Le jeton d'accès OAuth est gardé dans un fichier jusqu'à
+son expiration, un conteneur qui redémarre le réutilise au lieu d'en
+redemander un. Les identifiants sont construits directement avec
+google-auth et passés tels quels à gspread (6.x reconstruit ceux
+d'oauth2client, sans leur jeton).
+
+Demarrage ouvre le Répertoire dans un thread puis lit une première fois
+l'index de la campagne principale (cache partagé déjà chaud pour la
+première session). Une erreur est gardée telle quelle, relancer() refait
+une tentative.
+"""
+import datetime
+import json
+import os
+import threading
+from pathlib import Path
+
+from stockage import Repertoire, RepertoireMemoire, RepertoireSheets, RepertoireSQLite
+
+SCOPE = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+MARGE_JETON = 60  # s : un jeton qui expire plus tôt que ça est redemandé
+
+
+class ConnexionImpossible(Exception):
+    pass
+
+
+def _lire_jeton(chemin):
+    try: jeton = json.loads(Path(chemin).read_text(encoding="utf-8"))
+    except (OSError, ValueError): return None
+    try: expiration = datetime.datetime.fromisoformat(jeton["expiration"])
+    except (KeyError, TypeError, ValueError): return None
+    if expiration - datetime.timedelta(seconds=MARGE_JETON) <= datetime.datetime.utcnow(): return None
+    return jeton["jeton"], expiration
+
+
+def _ecrire_jeton(chemin, creds):
+    expiration = getattr(creds, "expiry", None)  # google-auth : UTC sans fuseau
+    if not getattr(creds, "token", None) or expiration is None: return
+    try:
+        fd = os.open(chemin, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)  # jeton : lisible du seul propriétaire
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"jeton": creds.token, "expiration": expiration.isoformat()}, f)
+    except OSError: pass  # disque en lecture seule : on redemandera un jeton
+
+
+def ouvrir_sheets(compte, ttl=60, jeton=".jeton_oauth.json", classeur="DndData"):
+    """compte : chemin du fichier de clé ou dictionnaire du compte de service."""
+    import gspread
+    from google.oauth2.service_account import Credentials
+    if isinstance(compte, dict): creds = Credentials.from_service_account_info(compte, scopes=SCOPE)
+    else: creds = Credentials.from_service_account_file(str(compte), scopes=SCOPE)
+    garde = _lire_jeton(jeton) if jeton else None
+    # Jeton encore valide : creds.valid, la première requête ne refait pas l'échange OAuth
+    if garde: creds.token, creds.expiry = garde
+    client = gspread.authorize(creds)
+    repertoire = RepertoireSheets(client.open(classeur), ttl=ttl)
+    if jeton and not garde: _ecrire_jeton(jeton, creds)
+    return repertoire
+
+
+def ouvrir_repertoire(conf, compte=None):
+    """Répertoire décrit par la config [stockage] ; compte : identifiants Google éventuels."""
+    type_backend = conf.get("backend", "sheets")
+    ttl = float(conf.get("cache_ttl", 60))  # durée sans aucune vérification du roster partagé
+    if type_backend == "sqlite": return RepertoireSQLite(conf.get("chemin", "dnd.db"), ttl=ttl)
+    if type_backend == "memoire": return RepertoireMemoire(ttl=ttl)
+    if compte is None:
+        raise ConnexionImpossible("Aucun identifiant Google : service_account.json ou [gcp_service_account] dans les secrets.")
+    return ouvrir_sheets(compte, ttl=ttl, jeton=conf.get("jeton", ".jeton_oauth.json"))
+
+
+class Demarrage:
+    def __init__(self, ouvrir, campagne=Repertoire.DEFAUT):
+        self._ouvrir = ouvrir          # () -> Repertoire, appelé dans le thread
+        self.campagne = campagne       # index préchargé
+        self._verrou = threading.Lock()
+        self._fini = threading.Event()
+        self._thread = None
+        self.repertoire = None
+        self.erreur = None
+        self.relancer()
+
+    def relancer(self):
+        with self._verrou:
+            if self._thread is not None and self._thread.is_alive(): return
+            self._fini.clear()
+            self.erreur = None
+            self._thread = threading.Thread(target=self._executer, daemon=True, name="demarrage")
+            self._thread.start()
+
+    def _executer(self):
+        try:
+            repertoire = self._ouvrir()
+            try: repertoire.backend(self.campagne).charger_index()
+            except Exception: pass  # la première session relira et affichera l'erreur
+            self.repertoire = repertoire
+        except Exception as e: self.erreur = e
+        finally: self._fini.set()
+
+    def attendre(self, timeout=None):
+        """True une fois la tentative terminée (réussie ou non)."""
+        return self._fini.wait(timeout)
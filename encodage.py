@@ -0,0 +1,161 @@
+"""Format de stockage compact et versionné de la cellule DATA_JSON.
+
+- v1 (historique) : json.dumps(perso) tel quel, commence par "{".
+- v2 : préfixe "2:" puis JSON compact, clés courtes et tableaux
+  positionnels pour les enregistrements qui ont exactement le schéma
+  attendu (les autres restent en dictionnaire, rien n'est perdu).
+- v2 compressé : préfixe "2z:" puis base64(zlib(JSON compact)), utilisé
+  au-delà de SEUIL_COMPRESSION caractères si c'est plus court.
+- v3 ("3:" / "3z:") : comme v2, mais compétences et objets sont des
+  collections à identifiants stables (id -> entrée) ; leur ordre
+  d'affichage, perso["ordre"], est implicite dans l'encodage (entrées
+  écrites dans l'ordre, chacune précédée de son id).
+
+decoder() lit toutes les formes et migre les anciennes listes ; encoder()
+produit toujours la version courante.
+"""
+import base64
+import json
+import uuid
+import zlib
+
+VERSION = "3"
+SEUIL_COMPRESSION = 2048
+
+# Champs des enregistrements, dans l'ordre du tableau positionnel
+CHAMPS_INFOS = ["nom", "race", "classe", "niveau"]
+CHAMPS_HP = ["max", "actuel", "temp"]
+CHAMPS_FEATURE = ["nom", "max", "actuel", "repos", "linked_pb"]
+CHAMPS_ITEM = ["nom", "max", "actuel", "repos"]
+CHAMPS_SORT = ["max", "actuel"]
+NIVEAUX_SORTS = [str(i) for i in range(1, 10)]
+CHAMPS_COLLECTIONS = {"features": CHAMPS_FEATURE, "items": CHAMPS_ITEM}
+
+# Clé longue -> clé courte au premier niveau
+CLES = {"infos": "i", "xp": "x", "hp": "h", "hit_dice_used": "d", "features": "f",
+        "items": "o", "spells_active": "a", "spells": "s"}
+CLES_LONGUES = {c: l for l, c in CLES.items()}
+
+
+def nouvel_id():
+    return uuid.uuid4().hex[:8]
+
+
+def migrer(perso):
+    """Listes positionnelles (v1 / v2) -> collections id -> entrée + perso["ordre"].
+
+    Idempotent ; remet aussi l'ordre d'accord avec les collections (ids
+    disparus retirés, ids absents ajoutés à la fin). Ne modifie pas les
+    objets reçus, à part perso lui-même.
+    """
+    ordre = dict(perso.get("ordre") or {})
+    for cle in CHAMPS_COLLECTIONS:
+        coll = perso.get(cle, {})
+        if isinstance(coll, list):
+            # Ids déterministes : deux sessions qui migrent la même ligne tombent d'accord
+            coll = {str(i): e for i, e in enumerate(coll)}
+            perso[cle] = coll
+            ordre[cle] = list(coll)
+        ids = [i for i in dict.fromkeys(ordre.get(cle) or []) if i in coll]
+        vus = set(ids)
+        ordre[cle] = ids + [i for i in coll if i not in vus]
+    perso["ordre"] = ordre
+    return perso
+
+
+def _compacter_collection(coll, ordre, champs):
+    return [[i] + ([coll[i][c] for c in champs] if isinstance(coll[i], dict) and list(coll[i]) == champs
+                   else [coll[i]]) for i in ordre]
+
+
+def _deplier_collection(val, champs):
+    coll = {}
+    for i, *vals in val:
+        coll[i] = dict(zip(champs, vals)) if len(vals) == len(champs) else vals[0]
+    return coll, list(coll)
+
+
+def _compacter_enreg(rec, champs):
+    if isinstance(rec, dict) and list(rec) == champs:
+        return [rec[c] for c in champs]
+    return rec
+
+
+def _deplier_enreg(val, champs):
+    if isinstance(val, list) and len(val) == len(champs):
+        return dict(zip(champs, val))
+    return val
+
+
+def _compacter_sorts(spells):
+    if isinstance(spells, dict) and list(spells) == NIVEAUX_SORTS:
+        return [_compacter_enreg(spells[n], CHAMPS_SORT) for n in NIVEAUX_SORTS]
+    return spells
+
+
+def _deplier_sorts(val):
+    if isinstance(val, list) and len(val) == len(NIVEAUX_SORTS):
+        return {n: _deplier_enreg(v, CHAMPS_SORT) for n, v in zip(NIVEAUX_SORTS, val)}
+    return val
+
+
+_COMPACTEURS = {
+    "infos": lambda v: _compacter_enreg(v, CHAMPS_INFOS),
+    "hp": lambda v: _compacter_enreg(v, CHAMPS_HP),
+    "spells": _compacter_sorts,
+}
+_DEPLIEURS = {  # features / items : listes positionnelles du v2 seulement
+    "infos": lambda v: _deplier_enreg(v, CHAMPS_INFOS),
+    "hp": lambda v: _deplier_enreg(v, CHAMPS_HP),
+    "features": lambda v: [_deplier_enreg(f, CHAMPS_FEATURE) for f in v] if isinstance(v, list) else v,
+    "items": lambda v: [_deplier_enreg(i, CHAMPS_ITEM) for i in v] if isinstance(v, list) else v,
+    "spells": _deplier_sorts,
+}
+
+
+def compacter(perso):
+    """Personnage -> structure compacte (clés courtes, tableaux)."""
+    perso = migrer(dict(perso))
+    compact, autres = {}, {}
+    for cle, val in perso.items():
+        if cle == "ordre": continue  # implicite : ordre des entrées encodées
+        if cle in CHAMPS_COLLECTIONS:
+            compact[CLES[cle]] = _compacter_collection(val, perso["ordre"][cle], CHAMPS_COLLECTIONS[cle])
+        elif cle in CLES: compact[CLES[cle]] = _COMPACTEURS.get(cle, lambda v: v)(val)
+        else: autres[cle] = val  # clés inconnues conservées telles quelles
+    if autres: compact["_"] = autres
+    return compact
+
+
+def deplier(compact, version=VERSION):
+    """Structure compacte -> personnage."""
+    perso, ordre = {}, {}
+    for courte, val in compact.items():
+        if courte == "_": continue
+        cle = CLES_LONGUES[courte]
+        if cle in CHAMPS_COLLECTIONS and version == VERSION:
+            perso[cle], ordre[cle] = _deplier_collection(val, CHAMPS_COLLECTIONS[cle])
+        else: perso[cle] = _DEPLIEURS.get(cle, lambda v: v)(val)
+    perso.update(compact.get("_", {}))
+    perso["ordre"] = ordre
+    return migrer(perso)
+
+
+def encoder(perso):
+    texte = json.dumps(compacter(perso), ensure_ascii=False, separators=(",", ":"))
+    if len(texte) > SEUIL_COMPRESSION:
+        z = base64.b64encode(zlib.compress(texte.encode("utf-8"), 9)).decode("ascii")
+        if len(z) + 3 < len(texte): return f"{VERSION}z:{z}"
+    return f"{VERSION}:{texte}"
+
+
+def decoder(cellule):
+    if cellule.startswith("{"):  # v1 : JSON brut historique
+        return migrer(json.loads(cellule))
+    version, _, corps = cellule.partition(":")
+    compresse = version.endswith("z")
+    if compresse: version = version[:-1]
+    if version not in ("2", VERSION):
+        raise ValueError(f"Format DATA_JSON inconnu : {version!r}")
+    if compresse: corps = zlib.decompress(base64.b64decode(corps)).decode("utf-8")
+    return deplier(json.loads(corps), version)
@@ -0,0 +1,229 @@
+"""Journal local des modifications, en ajout seul.
+
+Chaque session a son fichier `<dossier>/<session>.jsonl`, une ligne JSON
+par événement :
+- {"e": "ouvrir", "c": campagne, "n": nom, "r": rev, "b": data} : début
+  (ou reprise après une sauvegarde) du travail sur un personnage, depuis
+  la version stockée (rev, data) ; le fichier repart de là ;
+- {"e": "set", "p": chemin, "v": valeur} : une modification.
+
+Les événements sont mis en tampon et écrits par un thread, un fsync par
+fichier et par lot (toutes les `intervalle` secondes). Après une coupure,
+etat() relit le fichier pour rejouer les modifications sur leur base,
+puis les écrire comme une sauvegarde depuis cette base : ce qu'une autre
+session a changé entre-temps est fusionné ou signalé en conflit, jamais
+écrasé.
+
+Le même thread compacte : les sessions inactives depuis `inactivite`
+secondes voient leurs modifications repliées dans le personnage stocké
+(écrites depuis leur base, au nom de la session), puis leur fichier est
+ramené à la seule ligne "ouvrir" sur la nouvelle version. Sur un conflit
+(ou sans base) le fichier est gardé tel quel, pour la reprise de la session.
+"""
+import copy
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+
+def poser_chemin(data, chemin, valeur):
+    """data[chemin...] = valeur ; chemin vide = tout le personnage."""
+    if not chemin: return valeur
+    ref = data
+    for cle in chemin[:-1]: ref = ref[_cle(ref, cle)]
+    ref[_cle(ref, chemin[-1])] = valeur
+    return data
+
+
+def rejouer(data, modifs):
+    """Applique les modifications du journal ; renvoie (data, nombre d'ignorées).
+
+    Une modification dont le parent n'existe plus (compétence supprimée
+    depuis par une autre session...) est ignorée plutôt que de bloquer
+    toute la reprise.
+    """
+    ignorees = 0
+    for chemin, valeur in modifs:
+        try: data = poser_chemin(data, chemin, valeur)
+        except (KeyError, IndexError, TypeError): ignorees += 1
+    return data, ignorees
+
+
+def modifs_finales(data, modifs):
+    """{chemin: valeur dans data} des chemins du journal, parents d'abord, pour appliquer_modifs.
+
+    None si le journal remplace tout le personnage : fusion complète.
+    """
+    chemins = []
+    for chemin, valeur in modifs:
+        if not chemin: return None
+        chemins.append(tuple(chemin))
+    finales = {}
+    for chemin in sorted(set(chemins), key=len):
+        if any(chemin[:k] in finales for k in range(1, len(chemin))): continue
+        try: finales[chemin] = copy.deepcopy(valeur_chemin(data, chemin))
+        except (KeyError, IndexError, TypeError): continue  # ignorée au rejeu
+    return finales
+
+
+def valeur_chemin(data, chemin):
+    for cle in chemin: data = data[_cle(data, cle)]
+    return data
+
+
+def _cle(ref, cle):
+    # Journaux d'avant les ids : un index de liste devient l'id migré correspondant
+    return str(cle) if isinstance(ref, dict) and isinstance(cle, int) else cle
+
+
+class Journal:
+    def __init__(self, dossier="journal", intervalle=0.2, inactivite=60, conservation=86400):
+        self.dossier = Path(dossier)
+        self.dossier.mkdir(parents=True, exist_ok=True)
+        self.intervalle = intervalle       # regroupe les fsync
+        self.inactivite = inactivite       # délai avant repli d'une session silencieuse
+        self.conservation = conservation   # fichiers sans modification supprimés au-delà
+        self._cond = threading.Condition()
+        self._tampon = {}                  # session -> [("ajout" | "reset", ligne | None)]
+        self._en_conflit = {}              # chemin -> mtime du fichier laissé à la session
+        self._files = {}                   # campagne -> FileSauvegarde
+        self._dernier_compactage = time.monotonic()
+        threading.Thread(target=self._boucle, daemon=True, name="journal").start()
+
+    def _chemin(self, session):
+        return self.dossier / f"{session}.jsonl"
+
+    def brancher(self, campagne, file_sauvegarde):
+        """File d'écriture utilisée par le compacteur pour cette campagne."""
+        with self._cond: self._files[campagne] = file_sauvegarde
+
+    def _poser(self, session, op, evenement=None):
+        ligne = json.dumps(evenement, ensure_ascii=False, separators=(",", ":")) if evenement else None
+        with self._cond:
+            self._tampon.setdefault(session, []).append((op, ligne))
+            self._cond.notify()
+
+    def ouvrir(self, session, campagne, nom, base):
+        # Repart d'un fichier vide : ce qui précède est sauvegardé ou abandonné
+        self._poser(session, "reset", self._ouverture(campagne, nom, base))
+
+    @staticmethod
+    def _ouverture(campagne, nom, base):
+        rev, data = base
+        return {"e": "ouvrir", "c": campagne, "n": nom, "r": rev, "b": data}
+
+    def clore(self, session):
+        self._poser(session, "reset")
+
+    def ajouter(self, session, chemin, valeur):
+        self._poser(session, "ajout", {"e": "set", "p": list(chemin), "v": valeur})
+
+    def vider(self, timeout=5):
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._tampon, timeout)
+
+    def etat(self, session):
+        """{"campagne", "nom", "base", "modifs": [(chemin, valeur)]} de la session, ou None.
+
+        base : (rev, data) ouverts, None pour un journal qui ne la porte pas.
+        """
+        self.vider()
+        return self._lire(self._chemin(session))
+
+    @staticmethod
+    def _lire(chemin):
+        try: lignes = chemin.read_text(encoding="utf-8").splitlines()
+        except OSError: return None
+        etat = None
+        for ligne in lignes:
+            try: ev = json.loads(ligne)
+            except ValueError: continue  # dernière ligne tronquée par une coupure
+            if ev.get("e") == "ouvrir":
+                base = (ev["r"], ev["b"]) if "r" in ev else None
+                etat = {"campagne": ev["c"], "nom": ev["n"], "base": base, "modifs": []}
+            elif ev.get("e") == "set" and etat is not None: etat["modifs"].append((ev["p"], ev["v"]))
+        return etat
+
+    def _boucle(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._tampon, timeout=self.intervalle * 10)
+            time.sleep(self.intervalle)
+            with self._cond: lot, self._tampon = self._tampon, {}
+            for session, ops in lot.items():
+                try: self._ecrire(session, ops)
+                except OSError: pass  # disque plein / lecture seule : le journal n'est qu'un filet
+            with self._cond: self._cond.notify_all()
+            if time.monotonic() - self._dernier_compactage > self.inactivite / 2:
+                self._dernier_compactage = time.monotonic()
+                self.compacter()
+
+    def _ecrire(self, session, ops):
+        chemin = self._chemin(session)
+        # Seul le dernier reset compte, les ajouts suivants vont dans le même fsync
+        dernier_reset = max((i for i, (op, l) in enumerate(ops) if op == "reset"), default=None)
+        if dernier_reset is not None:
+            op, ligne = ops[dernier_reset]
+            ops = ops[dernier_reset + 1:]
+            if ligne is None and not ops:
+                chemin.unlink(missing_ok=True)
+                return
+            mode, lignes = "w", ([ligne] if ligne else [])
+        else: mode, lignes = "a", []
+        lignes += [l for op, l in ops]
+        with open(chemin, mode, encoding="utf-8") as f:
+            f.write("".join(l + "\n" for l in lignes))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def compacter(self):
+        """Replie les modifications des sessions inactives dans le stockage."""
+        maintenant = time.time()
+        for chemin in self.dossier.glob("*.jsonl"):
+            session = chemin.stem
+            try: mtime = chemin.stat().st_mtime
+            except OSError: continue
+            age = maintenant - mtime
+            if age < self.inactivite or self._en_conflit.get(chemin) == mtime: continue
+            with self._cond:
+                if session in self._tampon: continue  # la session écrit encore
+            etat = self._lire(chemin)
+            if etat is None or not etat["modifs"]:
+                if age > self.conservation: chemin.unlink(missing_ok=True)
+                continue
+            try: replie = self._replier(session, etat)
+            except Exception: continue  # stockage indisponible : on retentera
+            if replie is False: continue
+            if replie == "garder":
+                # Laissé à la reprise de la session, sans le retenter à chaque passage
+                self._en_conflit[chemin] = mtime
+                continue
+            # None : rien de rejouable, le fichier est fermé plutôt que relu à chaque passage
+            ligne = None if replie is None else json.dumps(
+                self._ouverture(etat["campagne"], etat["nom"], replie), ensure_ascii=False)
+            with self._cond:
+                # Devant les événements arrivés pendant le repli : eux ne sont pas repliés
+                self._tampon.setdefault(session, []).insert(0, ("reset", ligne))
+                self._cond.notify()
+
+    def _replier(self, session, etat):
+        # Nouvelle base (rev, data) : écrit ; "garder" : conflit ou journal sans base, laissé
+        # à la reprise de la session ; False : pas maintenant ; None : journal inutilisable
+        with self._cond: fs = self._files.get(etat["campagne"])
+        if fs is None: return False
+        if etat["base"] is None: return "garder"
+        nom = etat["nom"]
+        # Une sauvegarde de la session est en route : son résultat rouvrira le journal
+        if fs.lire(nom, session) is not None or (fs.statut(nom, session) or ("",))[0] == "conflit": return False
+        base = etat["base"]
+        data, _ = rejouer(copy.deepcopy(base[1]), etat["modifs"])
+        if not isinstance(data, dict): return None
+        # Renommé : c'est une nouvelle ligne, on attend une sauvegarde explicite
+        if data.get("infos", {}).get("nom") != nom: return False
+        # Écrit depuis la base du journal, comme l'aurait fait la session : une version
+        # plus récente est fusionnée champ par champ, pas écrasée
+        res, = fs.backend.ecrire_versions([(nom, data, base, modifs_finales(data, etat["modifs"]))])
+        if res["etat"] == "conflit": return "garder"
+        return res["rev"], res["data"]
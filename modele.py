@@ -0,0 +1,241 @@
+"""Modèle typé du personnage, avec suivi des champs modifiés.
+
+Perso.depuis_dict() construit le modèle une seule fois, à l'ouverture, à
+partir du JSON stocké. Le dictionnaire lu n'est pas modifié et sert tel
+quel de base au contrôle de concurrence : plus de copie profonde.
+
+Chaque affectation d'un champ (perso.hp.actuel = 3) note son chemin,
+("hp", "actuel"), dans le Perso racine. Les collections (features, items,
+leur ordre) se modifient par les méthodes de Perso, qui notent aussi
+leurs chemins. Du jeu de chemins modifiés on tire :
+- perso.modifie : modifications pas encore envoyées ("Sauvegarder *") ;
+- perso.recents() : chemins à écrire au journal ;
+- perso.envoi() : {chemin: valeur} depuis la base, que le stockage écrit
+  champ par champ sur une version plus récente (stockage.appliquer_modifs).
+"""
+import copy
+from dataclasses import dataclass, field, fields
+
+from encodage import migrer, nouvel_id
+
+COLLECTIONS = ("features", "items")
+
+
+class _Noeud:
+    """Enregistrement suivi : ses affectations de champs sont notées au Perso racine."""
+    __slots__ = ("_racine", "_chemin")
+
+    def __setattr__(self, nom, valeur):
+        racine = getattr(self, "_racine", None)
+        if racine is not None and nom[0] != "_" and getattr(self, nom, None) != valeur:
+            racine.noter(self._chemin + (nom,))
+        object.__setattr__(self, nom, valeur)
+
+    def _attacher(self, racine, chemin):
+        object.__setattr__(self, "_racine", racine)
+        object.__setattr__(self, "_chemin", chemin)
+        return self
+
+    @classmethod
+    def depuis_dict(cls, data):
+        connus = [f.name for f in fields(cls) if f.name != "autres" and f.init]
+        data = data if isinstance(data, dict) else {}
+        # Clés inconnues gardées telles quelles (copie : elles sont les seules partagées)
+        autres = copy.deepcopy({k: v for k, v in data.items() if k not in connus})
+        return cls(**{k: data[k] for k in connus if k in data}, autres=autres)
+
+    def vers_dict(self):
+        d = {f.name: getattr(self, f.name) for f in fields(self) if f.name != "autres" and f.init}
+        d = {k: v for k, v in d.items() if v is not None}
+        d.update(copy.deepcopy(self.autres))
+        return d
+
+
+@dataclass(slots=True)
+class Infos(_Noeud):
+    nom: str = "Nouveau Héros"
+    race: str = "Humain"
+    classe: str = "Guerrier"
+    niveau: int = 1
+    autres: dict = field(default_factory=dict)
+
+
+@dataclass(slots=True)
+class PV(_Noeud):
+    max: int = 10
+    actuel: int = 10
+    temp: int = 0
+    autres: dict = field(default_factory=dict)
+
+
+@dataclass(slots=True)
+class Entree(_Noeud):
+    """Compétence (linked_pb renseigné) ou objet (linked_pb None, absent du stockage)."""
+    nom: str = ""
+    max: int = 1
+    actuel: int = 1
+    repos: str = "Long"
+    linked_pb: bool = None
+    autres: dict = field(default_factory=dict)
+
+
+@dataclass(slots=True)
+class Emplacement(_Noeud):
+    max: int = 0
+    actuel: int = 0
+    autres: dict = field(default_factory=dict)
+
+
+def _brut(val):
+    """Valeur du modèle -> forme JSON stockée."""
+    if isinstance(val, _Noeud): return val.vers_dict()
+    if isinstance(val, dict): return {k: _brut(v) for k, v in val.items()}
+    if isinstance(val, list): return list(val)
+    return val
+
+
+def chemins_differents(a, b, chemin=()):
+    """Chemins où b diffère de a ; une clé retirée compte pour tout son dictionnaire."""
+    if a == b: return []
+    if not (isinstance(a, dict) and isinstance(b, dict)) or set(a) - set(b): return [chemin]
+    diff = []
+    for cle, val in b.items():
+        diff += chemins_differents(a[cle], val, chemin + (cle,)) if cle in a else [chemin + (cle,)]
+    return diff
+
+
+def _minimaux(chemins):
+    # Un chemin couvert par un parent déjà retenu est inutile
+    garde = set()
+    for chemin in sorted(chemins, key=len):
+        if not any(chemin[:k] in garde for k in range(len(chemin))): garde.add(chemin)
+    return garde
+
+
+@dataclass(slots=True)
+class Perso(_Noeud):
+    infos: Infos = field(default_factory=Infos)
+    xp: int = 0
+    hp: PV = field(default_factory=PV)
+    hit_dice_used: int = 0
+    features: dict = field(default_factory=dict)   # id -> Entree
+    items: dict = field(default_factory=dict)      # id -> Entree
+    ordre: dict = field(default_factory=dict)      # "features" / "items" -> [ids]
+    spells_active: bool = False
+    spells: dict = field(default_factory=dict)     # "1".."9" -> Emplacement
+    autres: dict = field(default_factory=dict)
+    # Suivi (hors données)
+    _modifs: dict = field(default_factory=dict, init=False, repr=False, compare=False)  # chemin -> n° d'ordre
+    _seq: int = field(default=0, init=False, repr=False, compare=False)
+    _envoye: int = field(default=0, init=False, repr=False, compare=False)
+    _recents: list = field(default_factory=list, init=False, repr=False, compare=False)
+    _sale: bool = field(default=False, init=False, repr=False, compare=False)
+
+    @classmethod
+    def depuis_dict(cls, data, base=None):
+        """Modèle d'un personnage stocké ; avec `base`, ce qui diffère de base est noté comme modifié."""
+        data = migrer(dict(data))
+        perso = cls(
+            infos=Infos.depuis_dict(data.get("infos")),
+            xp=data.get("xp", 0),
+            hp=PV.depuis_dict(data.get("hp")),
+            hit_dice_used=data.get("hit_dice_used", 0),
+            features={i: Entree.depuis_dict(e) for i, e in data["features"].items()},
+            items={i: Entree.depuis_dict(e) for i, e in data["items"].items()},
+            ordre={k: list(v) for k, v in data["ordre"].items()},
+            spells_active=data.get("spells_active", False),
+            spells={lvl: Emplacement.depuis_dict((data.get("spells") or {}).get(lvl)) for lvl in map(str, range(1, 10))},
+            autres=copy.deepcopy({k: v for k, v in data.items() if k not in _CHAMPS_PERSO}),
+        )
+        perso._attacher(perso, ())
+        perso.infos._attacher(perso, ("infos",))
+        perso.hp._attacher(perso, ("hp",))
+        for liste in COLLECTIONS:
+            for i, e in getattr(perso, liste).items(): e._attacher(perso, (liste, i))
+        for lvl, s in perso.spells.items(): s._attacher(perso, ("spells", lvl))
+        if base is not None:
+            for chemin in chemins_differents(migrer(dict(base)) if base else {}, perso.vers_dict()):
+                perso.noter(chemin)
+        return perso
+
+    def vers_dict(self):
+        d = {"infos": self.infos.vers_dict(), "xp": self.xp, "hp": self.hp.vers_dict(),
+             "hit_dice_used": self.hit_dice_used,
+             "features": _brut(self.features), "items": _brut(self.items), "ordre": _brut(self.ordre),
+             "spells_active": self.spells_active, "spells": _brut(self.spells)}
+        d.update(copy.deepcopy(self.autres))
+        return d
+
+    # --- suivi ---
+    def noter(self, chemin):
+        self._seq += 1
+        self._modifs[tuple(chemin)] = self._seq
+        self._recents.append(tuple(chemin))
+        self._sale = True
+
+    @property
+    def modifie(self):
+        return self._sale
+
+    def recents(self):
+        """Chemins notés depuis le dernier appel (pour le journal), parents d'abord."""
+        chemins, self._recents = _minimaux(self._recents), []
+        return [list(c) for c in sorted(chemins, key=len)]
+
+    def non_ecrits(self):
+        """Chemins modifiés depuis la base (envoyés ou non), parents d'abord."""
+        return [list(c) for c in sorted(_minimaux(self._modifs), key=len)]
+
+    def envoi(self):
+        """{chemin: valeur} de tout ce qui a changé depuis la base ; marque ces changements envoyés."""
+        self._envoye, self._sale = self._seq, False
+        return {chemin: self.valeur(chemin) for chemin in _minimaux(self._modifs)}
+
+    def rebaser(self, tout=False):
+        """Le dernier envoi est écrit et devient la base (tout : plus rien ne diffère)."""
+        if tout: self._modifs, self._sale = {}, False
+        else: self._modifs = {c: n for c, n in self._modifs.items() if n > self._envoye}
+
+    # --- accès par chemin ---
+    def valeur(self, chemin):
+        """Valeur (forme stockée) au chemin, None s'il n'existe pas."""
+        val = self
+        for cle in chemin:
+            val = val.get(cle) if isinstance(val, dict) else getattr(val, cle, None) if isinstance(val, _Noeud) else None
+        return _brut(val)
+
+    def poser(self, chemin, valeur):
+        ref = self
+        for cle in chemin[:-1]: ref = ref[cle] if isinstance(ref, dict) else getattr(ref, cle)
+        setattr(ref, chemin[-1], valeur)
+
+    # --- collections ---
+    def entrees(self, liste):
+        coll = getattr(self, liste)
+        return [(cle, coll[cle]) for cle in self.ordre[liste]]
+
+    def ajouter(self, liste, entree):
+        cle = nouvel_id()
+        getattr(self, liste)[cle] = entree._attacher(self, (liste, cle))
+        self.ordre[liste].append(cle)
+        self.noter((liste, cle))
+        self.noter(("ordre", liste))
+        return cle
+
+    def supprimer(self, liste, cle):
+        del getattr(self, liste)[cle]
+        self.ordre[liste].remove(cle)
+        self.noter((liste,))
+        self.noter(("ordre", liste))
+
+    def deplacer(self, liste, cle, direction):
+        # Seul l'ordre bouge : les entrées gardent leur id
+        ordre = self.ordre[liste]
+        index = ordre.index(cle)
+        new_index = index + direction
+        if 0 <= new_index < len(ordre):
+            ordre[index], ordre[new_index] = ordre[new_index], ordre[index]
+            self.noter(("ordre", liste))
+
+
+_CHAMPS_PERSO = [f.name for f in fields(Perso) if f.init and f.name != "autres"]
@@ -0,0 +1,146 @@
+"""Instrumentation des chemins chauds.
+
+chrono("op") mesure un bloc (durée, appels API et octets faits pendant le
+bloc, y compris dans les blocs imbriqués) ; api() est appelé par les
+backends à chaque requête réseau. Les mesures sont gardées sur une
+fenêtre glissante par opération (p50 / p95) pour tout le processus, et
+chaque mesure part aussi en ligne JSON sur le logger "dnd.perf".
+
+Les blocs ouverts sont suivis par thread : le script d'une session et le
+thread d'écriture ne se mélangent pas.
+
+Compter les octets sérialise chaque charge utile une fois de plus : ce
+n'est fait qu'une fois les mesures demandées (activer_octets(), ?perf=1
+ou DND_PERF=1) ; sinon seuls durées et appels sont comptés.
+"""
+import contextlib
+import functools
+import json
+import logging
+import threading
+import time
+from collections import Counter, defaultdict, deque
+
+journal = logging.getLogger("dnd.perf")
+
+FENETRE = 200  # dernières mesures gardées par opération
+
+
+def taille(obj):
+    """Taille approximative (octets JSON) d'une charge utile envoyée ou reçue."""
+    if obj is None: return 0
+    if isinstance(obj, str): return len(obj.encode("utf-8"))
+    try: return len(json.dumps(obj, ensure_ascii=False, default=lambda o: getattr(o, "value", None)).encode("utf-8"))
+    except (TypeError, ValueError): return len(str(obj))
+
+
+def _centile(valeurs, q):
+    v = sorted(valeurs)
+    return v[min(len(v) - 1, int(q * len(v)))] if v else 0.0
+
+
+class Mesures:
+    def __init__(self, fenetre=FENETRE):
+        self._verrou = threading.Lock()
+        self._local = threading.local()
+        self._durees = defaultdict(lambda: deque(maxlen=fenetre))
+        self._appels = defaultdict(lambda: deque(maxlen=fenetre))
+        self._octets = defaultdict(lambda: deque(maxlen=fenetre))
+        self.api_total = Counter()   # méthode -> appels
+        self.octets_total = Counter()  # "envoyes" / "recus"
+        self.octets = False            # tailles des charges utiles, sur demande
+
+    @property
+    def _pile(self):
+        if not hasattr(self._local, "pile"): self._local.pile = []
+        return self._local.pile
+
+    @property
+    def trace(self):
+        """Mesures du thread courant depuis le dernier demarrer()."""
+        if not hasattr(self._local, "trace"): self._local.trace = []
+        return self._local.trace
+
+    def api(self, methode, envoye=None, recu=None):
+        env, rec = (taille(envoye), taille(recu)) if self.octets else (0, 0)
+        with self._verrou:
+            self.api_total[methode] += 1
+            self.octets_total["envoyes"] += env
+            self.octets_total["recus"] += rec
+        for cadre in self._pile:
+            cadre["appels"] += 1
+            cadre["octets"] += env + rec
+
+    def ouvrir(self, op):
+        cadre = {"op": op, "t0": time.perf_counter(), "appels": 0, "octets": 0}
+        self._pile.append(cadre)
+        return cadre
+
+    def fermer(self, cadre, erreur=None):
+        if cadre in self._pile: self._pile.remove(cadre)
+        ms = (time.perf_counter() - cadre["t0"]) * 1000
+        op = cadre["op"]
+        with self._verrou:
+            self._durees[op].append(ms)
+            self._appels[op].append(cadre["appels"])
+            self._octets[op].append(cadre["octets"])
+        ligne = {"op": op, "ms": round(ms, 2), "appels": cadre["appels"], "octets": cadre["octets"]}
+        if erreur: ligne["erreur"] = erreur
+        self.trace.append(ligne)
+        journal.info(json.dumps(ligne, ensure_ascii=False))
+        return ligne
+
+    @contextlib.contextmanager
+    def chrono(self, op):
+        cadre = self.ouvrir(op)
+        erreur = None
+        try: yield cadre
+        except Exception as e:
+            # st.rerun() / st.stop() passent aussi par ici : mesure quand même
+            erreur = type(e).__name__
+            raise
+        finally: self.fermer(cadre, erreur)
+
+    def demarrer(self, op):
+        """Début d'un bloc qui ne tient pas dans un `with` (le script entier).
+
+        Oublie les blocs laissés ouverts par un run interrompu (st.rerun)."""
+        self._local.pile = []
+        self._local.trace = []
+        return self.ouvrir(op)
+
+    def stats(self):
+        with self._verrou:
+            ops = {op: (list(d), list(self._appels[op]), list(self._octets[op])) for op, d in self._durees.items()}
+        return {op: {"n": len(d), "p50_ms": round(_centile(d, 0.5), 1), "p95_ms": round(_centile(d, 0.95), 1),
+                     "max_ms": round(max(d), 1), "appels_moy": round(sum(a) / len(a), 1),
+                     "octets_moy": int(sum(o) / len(o))}
+                for op, (d, a, o) in sorted(ops.items())}
+
+
+mesures = Mesures()
+api = mesures.api
+chrono = mesures.chrono
+
+
+def activer_octets():
+    """Compte aussi les octets envoyés / reçus par chaque appel API."""
+    mesures.octets = True
+
+
+def activer_journal(niveau=logging.INFO):
+    """Envoie les lignes de mesure sur stderr (désactivées par défaut)."""
+    activer_octets()
+    if not journal.handlers: journal.addHandler(logging.StreamHandler())
+    journal.setLevel(niveau)
+    journal.propagate = False
+
+
+def chronometrer(op):
+    """Décorateur : chrono(op) autour de chaque appel."""
+    def deco(fn):
+        @functools.wraps(fn)
+        def enveloppe(*args, **kwargs):
+            with chrono(op): return fn(*args, **kwargs)
+        return enveloppe
+    return deco
@@ -0,0 +1,1064 @@
+"""Stockage des personnages.
+
+Trois backends interchangeables derrière la même interface :
+- BackendSheets : la feuille Google Sheets
+- BackendSQLite : fichier local en mode WAL, une ligne par personnage
+- BackendMemoire : dictionnaire en mémoire (tests, démo sans identifiants)
+
+Une ligne par personnage : NOM_PERSO | DATA_JSON | CLASSE | NIVEAU | PV | MAJ | REV.
+DATA_JSON est au format compact versionné de encodage.py.
+Les colonnes de résumé (dénormalisées, tenues à jour à chaque écriture)
+suffisent à la page d'accueil ; le DATA_JSON n'est lu et décodé qu'à
+l'ouverture d'un personnage.
+
+Les personnages sont partitionnés par campagne : un Repertoire associe à
+chaque campagne son propre backend (un onglet Sheets, un fichier SQLite),
+avec sa propre révision. Charger ou sauvegarder ne touche que la
+campagne active.
+
+L'objet backend est partagé par toutes les sessions (st.cache_resource) et
+sert aussi de cache : pendant `ttl` secondes on ne relit rien, puis on
+compare un simple numéro de révision (bumpé à chaque écriture) avant de
+relire l'index. Chaque écriture note aussi, à côté de la révision, quels
+personnages elle a touchés (les CHANGEMENTS_MAX dernières, tenant en
+CHANGEMENTS_TAILLE_MAX caractères) : quand la révision a bougé, seules ces
+lignes de résumé sont relues. Une écriture de plus de CHANGEMENTS_NOMS_MAX
+personnages (import...) est notée sans ses noms : "tout relire".
+
+Contrôle de concurrence optimiste : chaque ligne porte sa propre révision
+(REV). Une session sauvegarde en indiquant la révision qu'elle a chargée ;
+si la ligne a bougé entre-temps, on tente une fusion à trois voies champ
+par champ, et on ne renvoie un conflit que si les deux côtés ont modifié
+le même champ différemment.
+
+FileSauvegarde écrit en tâche de fond : les sauvegardes successives d'une
+session pour un personnage sont fusionnées (la dernière l'emporte),
+plusieurs personnages partent dans le même appel, et les erreurs
+temporaires sont réessayées.
+
+Chaque requête Google Sheets est comptée (appels, octets) par perf.py.
+"""
+import bisect
+import contextlib
+import copy
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import perf
+from encodage import decoder, encoder
+
+EN_TETE = ["NOM_PERSO", "DATA_JSON", "CLASSE", "NIVEAU", "PV", "MAJ", "REV"]
+COLONNES_RESUME = ["classe", "niveau", "pv", "maj", "rev"]
+
+CHANGEMENTS_MAX = 50  # écritures gardées dans le journal des changements
+CHANGEMENTS_NOMS_MAX = 200  # personnages au-delà desquels une écriture est notée "tout relire"
+CHANGEMENTS_TAILLE_MAX = 40000  # caractères du journal sérialisé (une cellule Sheets en tient 50 000)
+
+_ABSENT = object()
+
+
+def _taille(objet):
+    return len(json.dumps(objet, ensure_ascii=False, separators=(",", ":")))
+
+
+def _noter_changement(changements, rev, modifies, supprimes):
+    """Journal des changements augmenté de l'écriture `rev`, borné en nombre et en taille."""
+    entree = [rev, list(modifies), list(supprimes)]
+    if len(entree[1]) + len(entree[2]) > CHANGEMENTS_NOMS_MAX or _taille(entree) > CHANGEMENTS_TAILLE_MAX // 2:
+        entree = [rev, None, None]  # noms omis : les autres instances relisent tout
+    changements = (list(changements) + [entree])[-CHANGEMENTS_MAX:]
+    # Les plus anciennes d'abord oubliées : seules les instances très en retard relisent tout
+    tailles = [_taille(c) + 1 for c in changements]
+    debut, total = 0, sum(tailles) + 1
+    while total > CHANGEMENTS_TAILLE_MAX:
+        total -= tailles[debut]
+        debut += 1
+    return changements[debut:]
+
+
+def resume(data, maj="", rev=1):
+    """Colonnes de résumé d'un personnage (page d'accueil)."""
+    infos, hp = data.get("infos", {}), data.get("hp", {})
+    return {"classe": infos.get("classe", ""), "niveau": infos.get("niveau", 1),
+            "pv": f"{hp.get('actuel', 0)}/{hp.get('max', 0)}", "maj": maj, "rev": rev}
+
+
+def fusionner(base, mine, theirs, gagnant="mine", chemin=()):
+    """Fusion à trois voies récursive sur les dictionnaires.
+
+    Renvoie (fusion, conflits) ; conflits = chemins modifiés des deux côtés.
+    Sur un conflit on garde la valeur de `gagnant` ("mine" ou "theirs").
+    Les listes sont traitées comme des valeurs atomiques, sauf les ordres
+    d'affichage (perso["ordre"]) fusionnés comme des listes d'ids.
+    """
+    if mine == theirs: return _copie(mine), []
+    if mine == base: return _copie(theirs), []
+    if theirs == base: return _copie(mine), []
+    if chemin[:1] == ("ordre",) and isinstance(mine, list) and isinstance(theirs, list):
+        return _fusionner_ordre(base if isinstance(base, list) else [], mine, theirs, gagnant), []
+    if isinstance(mine, dict) and isinstance(theirs, dict):
+        base = base if isinstance(base, dict) else {}
+        fusion, conflits = {}, []
+        for cle in list(mine) + [c for c in theirs if c not in mine]:
+            val, sous = fusionner(base.get(cle, _ABSENT), mine.get(cle, _ABSENT),
+                                  theirs.get(cle, _ABSENT), gagnant, chemin + (cle,))
+            if val is not _ABSENT: fusion[cle] = val
+            conflits += sous
+        return fusion, conflits
+    return _copie(mine if gagnant == "mine" else theirs), [chemin]
+
+
+def _fusionner_ordre(base, mine, theirs, gagnant):
+    """Ordre du côté gagnant, sans les ids supprimés d'un côté, plus les ids ajoutés de l'autre."""
+    supprimes = (set(base) - set(mine)) | (set(base) - set(theirs))
+    premier, second = (mine, theirs) if gagnant == "mine" else (theirs, mine)
+    if premier == base: premier, second = second, premier  # l'autre côté seul a réordonné
+    fusion = [i for i in premier if i not in supprimes]
+    vus = set(fusion)
+    return fusion + [i for i in second if i not in vus and i not in supprimes]
+
+
+def appliquer_modifs(base, mine, modifs, theirs, gagnant="mine"):
+    """Écrit les champs modifiés depuis base (chemin -> valeur) sur theirs.
+
+    Même résultat que fusionner(base, mine, theirs) sans parcourir tout le
+    personnage : seuls les chemins de `modifs` sont comparés. Conflit si
+    theirs a changé un de ces champs autrement ; `mine` sert quand le
+    parent d'un champ n'existe plus chez theirs.
+    """
+    final, conflits = copy.deepcopy(theirs), []
+    for chemin, valeur in modifs.items():
+        chemin = tuple(chemin)
+        b, t = _lire(base, chemin), _lire(theirs, chemin)
+        if chemin[:1] == ("ordre",) and isinstance(valeur, list) and isinstance(t, list):
+            valeur = _fusionner_ordre(b if isinstance(b, list) else [], valeur, t, gagnant)
+        elif t != b and t != valeur:
+            conflits.append(chemin)
+            if gagnant != "mine": continue
+        ref = final
+        for k, cle in enumerate(chemin[:-1]):
+            if not isinstance(ref.get(cle), dict):
+                # Parent supprimé de l'autre côté : on le reprend entier
+                cle, valeur, chemin = chemin[k], _lire(mine, chemin[:k + 1]), chemin[:k + 1]
+                break
+            ref = ref[cle]
+        if valeur is _ABSENT: ref.pop(chemin[-1], None)
+        else: ref[chemin[-1]] = copy.deepcopy(valeur)
+    return final, conflits
+
+
+def _lire(data, chemin):
+    for cle in chemin:
+        if not isinstance(data, dict) or cle not in data: return _ABSENT
+        data = data[cle]
+    return data
+
+
+def _copie(val):
+    # Le résultat ne doit partager aucun objet avec les entrées
+    return val if val is _ABSENT else copy.deepcopy(val)
+
+
+def erreur_temporaire(e):
+    """Quota, erreur serveur ou réseau : ça vaut le coup de réessayer."""
+    code = getattr(getattr(e, "response", None), "status_code", None)
+    if code is not None: return code == 429 or code >= 500
+    if isinstance(e, sqlite3.OperationalError): return True  # base verrouillée
+    return isinstance(e, (ConnectionError, TimeoutError, OSError))
+
+
+def horodatage():
+    return time.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _ligne(valeurs):
+    return {"values": [{"userEnteredValue": {"stringValue": str(v)}} for v in valeurs]}
+
+
+def _plage(onglet, a1):
+    """Plage A1 préfixée de son onglet, pour les lectures sur plusieurs onglets."""
+    return "'" + onglet.replace("'", "''") + "'!" + a1
+
+
+def _rev(val):
+    try: return int(val)
+    except (TypeError, ValueError): return 1  # ligne antérieure aux révisions
+
+
+class Backend:
+    """Interface commune : charger_index / charger_perso / ecrire_versions / compacter."""
+    def __init__(self, ttl=60):
+        self._verrou = threading.RLock()  # partagé entre toutes les sessions
+        self._contenu = {}                # nom -> DATA_JSON déjà lu ou écrit
+        self.ttl = ttl
+        self.revision = 0                 # révision globale correspondant au cache
+        self._resumes = None              # nom -> résumé, partagé
+        self._changements = []            # [rev, modifiés, supprimés] des dernières écritures
+        self._cache_t = 0.0
+
+    def _rafraichir(self, age_max=None):
+        # Au plus une vérification de révision par ttl (ou age_max)
+        if self._resumes is not None and time.monotonic() - self._cache_t < (self.ttl if age_max is None else age_max): return
+        self._rattraper(*self._lire_changements())
+
+    def _rattraper(self, rev, changements):
+        # Cache amené à la révision stockée : relecture des seules lignes citées
+        # par le journal des changements, de tout l'index sinon
+        if self._resumes is not None:
+            if rev == self.revision:
+                self._cache_t = time.monotonic()
+                return
+            if self._appliquer_changements(rev, changements): return
+        self.revision = rev
+        self._changements = changements or []
+        self._resumes = dict(self._lire_resumes())
+        self._contenu = {}
+        self._cache_t = time.monotonic()
+
+    def _appliquer_changements(self, rev, changements):
+        # Le journal doit couvrir toutes les révisions manquées, sinon relecture complète
+        if not changements: return False
+        couvertes = {c[0] for c in changements}
+        if any(r not in couvertes for r in range(self.revision + 1, rev + 1)): return False
+        modifies, supprimes = set(), set()
+        for r, m, s in sorted(changements, key=lambda c: c[0]):
+            if r <= self.revision: continue
+            if m is None: return False  # écriture trop grosse pour être détaillée
+            modifies.update(m)
+            supprimes.difference_update(m)
+            supprimes.update(s)
+            modifies.difference_update(s)
+        resumes = self._lire_resumes_de(modifies, supprimes) if modifies or supprimes else {}
+        if resumes is None: return False
+        for nom in supprimes | modifies: self._contenu.pop(nom, None)
+        for nom in supprimes: self._resumes.pop(nom, None)
+        self._resumes.update(resumes)
+        self.revision = rev
+        self._changements = changements
+        self._cache_t = time.monotonic()
+        return True
+
+    def charger_index(self, age_max=None):
+        """nom -> résumé, sans lire aucun DATA_JSON.
+
+        age_max : fraîcheur voulue en secondes si plus courte que ttl (suivi en direct).
+        """
+        with self._verrou:
+            self._rafraichir(age_max)
+            return dict(self._resumes)
+
+    def charger_perso(self, nom):
+        """(personnage complet, révision de sa ligne), lu et décodé à la demande."""
+        return self.charger_persos([nom])[nom]
+
+    def charger_persos(self, noms, garder=True):
+        """nom -> (personnage, révision) ; les DATA_JSON manquants sont lus en un seul appel.
+
+        garder=False : les DATA_JSON lus ne restent pas en cache (export de tout le roster).
+        """
+        with self._verrou:
+            self._rafraichir()
+            contenus = {nom: self._contenu[nom] for nom in noms if nom in self._contenu}
+            a_lire = [nom for nom in noms if nom in self._resumes and nom not in contenus]
+            if a_lire:
+                for nom, contenu in self._lire_persos(a_lire).items():
+                    if contenu is not None: contenus[nom] = contenu
+            if garder: self._contenu.update(contenus)
+            persos = {}
+            for nom in noms:
+                try: persos[nom] = (decoder(contenus[nom]), self._resumes[nom]["rev"])
+                except: persos[nom] = (None, 0)
+            return persos
+
+    def invalider(self):
+        with self._verrou:
+            self._resumes = None
+
+    def appliquer(self, modifies, supprimes=()):
+        """Écritures inconditionnelles (la dernière l'emporte)."""
+        ecritures = [(nom, data, None) for nom, data in modifies.items()]
+        ecritures += [(nom, None, None) for nom in supprimes]
+        return self.ecrire_versions(ecritures)
+
+    def ecrire_versions(self, ecritures):
+        """Écritures conditionnelles, envoyées en un seul appel de stockage.
+
+        ecritures : liste de (nom, data, base[, modifs]) ; data None =
+        suppression ; base = (rev, data) tels que chargés par la session
+        (rev 0 : le personnage n'existait pas), ou None pour forcer
+        l'écriture ; modifs = {chemin: valeur} changés depuis base, pour
+        n'écrire que ces champs sur une version plus récente (sinon fusion
+        complète).
+        Renvoie, dans le même ordre, des dicts {"etat": "ok" | "fusion" |
+        "conflit", "rev", "data", "conflits"} ; sur un conflit, "data" est
+        la version stockée.
+        """
+        with self._verrou, self._transaction():
+            # Révision et journal relus dans la transaction : une autre instance (CLI,
+            # réplique) a pu écrire depuis, la nouvelle révision part de la sienne
+            actuelles, rev, changements = self._lire_pour_ecrire({nom for nom, *_ in ecritures})
+            self._rattraper(rev, changements)
+            courant = {}   # nom -> (rev, data) après les écritures précédentes du lot
+            resultats = []
+            for nom, data, base, *modifs in ecritures:
+                modifs = modifs[0] if modifs else None
+                rev_act = courant[nom][0] if nom in courant else actuelles.get(nom, 0)
+                etat, final = "ok", data
+                if base is not None and base[0] != rev_act:
+                    theirs = courant[nom][1] if nom in courant else self._lire_donnees(nom)
+                    if data is None or theirs is None:
+                        final, conflits = None, ([] if data is None and theirs is None else [()])
+                    elif modifs is not None:
+                        final, conflits = appliquer_modifs(base[1], data, modifs, theirs)
+                    else:
+                        final, conflits = fusionner(base[1], data, theirs)
+                    if conflits:
+                        resultats.append({"etat": "conflit", "rev": rev_act, "data": theirs, "conflits": conflits})
+                        continue
+                    etat = "fusion"
+                if final is None and rev_act == 0:
+                    resultats.append({"etat": etat, "rev": 0, "data": None, "conflits": []})
+                    continue
+                courant[nom] = (rev_act + 1 if final is not None else 0, final)
+                resultats.append({"etat": etat, "rev": courant[nom][0], "data": final, "conflits": []})
+            self._ecrire_lot(courant)
+            return resultats
+
+    def _lire_donnees(self, nom):
+        # Version stockée, sans passer par le cache (on sait qu'il est périmé)
+        contenu = self._lire_perso(nom)
+        if contenu is None: return None
+        self._contenu[nom] = contenu
+        try: return decoder(contenu)
+        except: return None
+
+    def _ecrire_lot(self, courant):
+        maj = horodatage()
+        lignes, supprimes = {}, []
+        for nom, (rev, data) in courant.items():
+            if data is None:
+                supprimes.append(nom)
+                continue
+            contenu = encoder(data)
+            lignes[nom] = (contenu, resume(data, maj, rev))
+        if not lignes and not supprimes: return
+        rev = self.revision + 1
+        changements = _noter_changement(self._changements, rev, lignes, supprimes)
+        self._ecrire(lignes, supprimes, rev, changements)
+        self.revision = rev
+        self._changements = changements
+        # Patch du cache partagé au lieu de tout relire
+        for nom in supprimes:
+            self._resumes.pop(nom, None)
+            self._contenu.pop(nom, None)
+        for nom, (contenu, res) in lignes.items():
+            self._resumes[nom] = res
+            self._contenu[nom] = contenu
+
+    def compacter(self):
+        """Réécriture complète (compactage / réparation / remplissage des résumés).
+
+        Sert aussi de migration : toutes les lignes sont réencodées au format courant.
+        Une ligne illisible (abîmée, ou d'un format plus récent) est gardée
+        telle quelle, avec des colonnes de résumé vides.
+        """
+        with self._verrou:
+            anciens = self._resumes or {}
+            lignes = {}
+            for nom, contenu, rev in self._lire_tout():
+                maj = anciens.get(nom, {}).get("maj", "")
+                try: data = decoder(contenu)
+                except:
+                    lignes[nom] = (contenu, {"classe": "", "niveau": "", "pv": "", "maj": maj, "rev": _rev(rev)})
+                    continue
+                lignes[nom] = (encoder(data), resume(data, maj, _rev(rev)))
+            rev = self._lire_revision() + 1
+            self._reecrire(lignes, rev)
+            self.revision = rev
+            self._changements = []  # tout a bougé : les autres instances relisent tout
+            self._resumes = {nom: res for nom, (c, res) in lignes.items()}
+            self._contenu = {nom: c for nom, (c, res) in lignes.items()}
+            self._cache_t = time.monotonic()
+
+    def _transaction(self):
+        return contextlib.nullcontext()
+
+    # A implémenter par chaque backend
+    def _lire_revision(self): raise NotImplementedError
+    def _lire_changements(self): return self._lire_revision(), None  # (rev, journal | None)
+    def _lire_pour_ecrire(self, noms): return (self._lire_revisions(noms), *self._lire_changements())
+    def _lire_resumes_de(self, modifies, supprimes): return None  # None : relecture complète
+    def _lire_revisions(self, noms): raise NotImplementedError
+    def _lire_resumes(self): raise NotImplementedError
+    def _lire_perso(self, nom): raise NotImplementedError
+    def _lire_persos(self, noms): return {nom: self._lire_perso(nom) for nom in noms}
+    def _lire_tout(self): raise NotImplementedError
+    def _ecrire(self, lignes, supprimes, rev, changements): raise NotImplementedError
+    def _reecrire(self, lignes, rev): raise NotImplementedError
+
+
+class BackendMemoire(Backend):
+    def __init__(self, data=None, ttl=60):
+        super().__init__(ttl)
+        self._lignes = {nom: (encoder(p), resume(p))
+                        for nom, p in (data or {}).items()}
+        self._rev_stockee = 0
+        self._changements_stockes = []
+
+    def _lire_revision(self):
+        return self._rev_stockee
+
+    def _lire_changements(self):
+        return self._rev_stockee, list(self._changements_stockes)
+
+    def _lire_resumes_de(self, modifies, supprimes):
+        return {nom: self._lignes[nom][1] for nom in modifies if nom in self._lignes}
+
+    def _lire_revisions(self, noms):
+        return {nom: self._lignes[nom][1]["rev"] for nom in noms if nom in self._lignes}
+
+    def _lire_resumes(self):
+        return [(nom, res) for nom, (c, res) in self._lignes.items()]
+
+    def _lire_perso(self, nom):
+        ligne = self._lignes.get(nom)
+        return ligne[0] if ligne else None
+
+    def _lire_tout(self):
+        return [(nom, c, res["rev"]) for nom, (c, res) in self._lignes.items()]
+
+    def _ecrire(self, lignes, supprimes, rev, changements):
+        for nom in supprimes: self._lignes.pop(nom, None)
+        self._lignes.update(lignes)
+        self._rev_stockee = rev
+        self._changements_stockes = changements
+
+    def _reecrire(self, lignes, rev):
+        self._lignes = dict(lignes)
+        self._rev_stockee = rev
+        self._changements_stockes = []
+
+
+class BackendSQLite(Backend):
+    def __init__(self, chemin="dnd.db", ttl=60):
+        super().__init__(ttl)
+        # Une seule connexion partagée entre les threads de session, protégée par le verrou
+        self.conn = sqlite3.connect(chemin, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS persos (nom TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (cle TEXT PRIMARY KEY, valeur TEXT)")
+        self._migrer()
+        self.conn.commit()
+
+    def _migrer(self):
+        # Ajout des colonnes de résumé sur une base existante
+        colonnes = {row[1] for row in self.conn.execute("PRAGMA table_info(persos)")}
+        manquantes = [c for c in COLONNES_RESUME if c not in colonnes]
+        if not manquantes: return
+        for c in manquantes:
+            defaut = " INTEGER NOT NULL DEFAULT 1" if c == "rev" else ""
+            self.conn.execute(f"ALTER TABLE persos ADD COLUMN {c}{defaut}")
+        for nom, data in self.conn.execute("SELECT nom, data FROM persos").fetchall():
+            try: res = resume(decoder(data))
+            except: continue
+            self.conn.execute("UPDATE persos SET classe = ?, niveau = ?, pv = ? WHERE nom = ?",
+                              (res["classe"], res["niveau"], res["pv"], nom))
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # Lecture des révisions et écriture dans la même transaction : vraiment atomique
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.conn.rollback()
+            raise
+        if self.conn.in_transaction: self.conn.commit()
+
+    def _lire_revision(self):
+        row = self.conn.execute("SELECT valeur FROM meta WHERE cle = 'revision'").fetchone()
+        return int(row[0]) if row else 0
+
+    def _lire_changements(self):
+        meta = dict(self.conn.execute("SELECT cle, valeur FROM meta WHERE cle IN ('revision', 'changements')"))
+        try: changements = json.loads(meta["changements"])
+        except (KeyError, ValueError): changements = None
+        return int(meta.get("revision", 0)), changements
+
+    def _poser_revision(self, rev, changements=()):
+        self.conn.executemany("INSERT OR REPLACE INTO meta (cle, valeur) VALUES (?, ?)",
+                              [("revision", str(rev)), ("changements", json.dumps(list(changements), ensure_ascii=False))])
+
+    def _lire_resumes_de(self, modifies, supprimes):
+        noms = list(modifies)
+        if not noms: return {}
+        marques = ", ".join("?" * len(noms))
+        rows = self.conn.execute(f"SELECT nom, classe, niveau, pv, maj, rev FROM persos WHERE nom IN ({marques})", noms)
+        return {row[0]: dict(zip(COLONNES_RESUME, row[1:])) for row in rows}
+
+    def _lire_revisions(self, noms):
+        noms = list(noms)
+        if not noms: return {}
+        marques = ", ".join("?" * len(noms))
+        return dict(self.conn.execute(f"SELECT nom, rev FROM persos WHERE nom IN ({marques})", noms))
+
+    def _lire_resumes(self):
+        rows = self.conn.execute("SELECT nom, classe, niveau, pv, maj, rev FROM persos ORDER BY rowid")
+        return [(row[0], dict(zip(COLONNES_RESUME, row[1:]))) for row in rows]
+
+    def _lire_perso(self, nom):
+        row = self.conn.execute("SELECT data FROM persos WHERE nom = ?", (nom,)).fetchone()
+        return row[0] if row else None
+
+    def _lire_persos(self, noms):
+        marques = ",".join("?" * len(noms))
+        return dict(self.conn.execute(f"SELECT nom, data FROM persos WHERE nom IN ({marques})", list(noms)))
+
+    def _lire_tout(self):
+        return self.conn.execute("SELECT nom, data, rev FROM persos ORDER BY rowid").fetchall()
+
+    def _inserer(self, lignes):
+        self.conn.executemany(
+            "INSERT INTO persos (nom, data, classe, niveau, pv, maj, rev) VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(nom) DO UPDATE SET data = excluded.data, classe = excluded.classe, "
+            "niveau = excluded.niveau, pv = excluded.pv, maj = excluded.maj, rev = excluded.rev",
+            [(nom, c) + tuple(res[k] for k in COLONNES_RESUME) for nom, (c, res) in lignes.items()])
+
+    def _ecrire(self, lignes, supprimes, rev, changements):
+        with self.conn:
+            self.conn.executemany("DELETE FROM persos WHERE nom = ?", [(n,) for n in supprimes])
+            self._inserer(lignes)
+            self._poser_revision(rev, changements)
+
+    def _reecrire(self, lignes, rev):
+        with self.conn:
+            self.conn.execute("DELETE FROM persos")
+            self._inserer(lignes)
+            self._poser_revision(rev)
+        self.conn.execute("VACUUM")
+
+
+class BackendSheets(Backend):
+    """Garde un index nom -> numéro de ligne pour des mises à jour ciblées.
+
+    La révision de la feuille est stockée dans une cellule `meta` =
+    (onglet, ligne, colonne) : A1 d'un onglet "_meta" (créé au besoin) pour
+    la feuille principale, sa ligne de l'annuaire pour une campagne ; la
+    cellule à sa droite porte le journal des changements (JSON). Elles sont
+    écrites dans le même batchUpdate que les lignes. Sheets n'a
+    pas d'écriture conditionnelle : les révisions des lignes, la révision et
+    le journal sont relus d'un seul appel juste avant l'écriture, la
+    fenêtre de course restante est minime.
+    """
+    FEUILLE_META = "_meta"
+    LIMITE_CELLULE = 50000
+
+    def __init__(self, sheet, ttl=60, meta=None):
+        super().__init__(ttl)
+        self.sheet = sheet
+        self.meta = meta or (self.FEUILLE_META, 1, 0)  # (onglet, ligne, colonne) de la révision
+        self._index = {}      # nom -> numéro de ligne (1 = en-tête)
+        self._nb_lignes = 0   # dernière ligne non vide
+        self._meta = None
+
+    def _feuille_meta(self):
+        if self._meta is None:
+            ss = self.sheet.spreadsheet
+            try: self._meta = self._appel(ss, "worksheet", self.meta[0])
+            except Exception: self._meta = self._appel(ss, "add_worksheet", self.meta[0], rows=1, cols=2)
+        return self._meta
+
+    @staticmethod
+    def _appel(cible, methode, *args, **kwargs):
+        # Toute requête réseau passe par ici : comptée même si elle échoue
+        res = None
+        try:
+            res = getattr(cible, methode)(*args, **kwargs)
+            return res
+        finally: perf.api(methode, args or None, res)
+
+    def _cellules_meta(self):
+        onglet, ligne, col = self.meta
+        return f"{chr(65 + col)}{ligne}:{chr(66 + col)}{ligne}"
+
+    def _lire_changements(self):
+        # Révision et journal des changements en un seul appel
+        return self._decoder_meta(self._appel(self._feuille_meta(), "get", self._cellules_meta()))
+
+    @staticmethod
+    def _decoder_meta(vals):
+        row = vals[0] if vals else []
+        try: rev = int(row[0])
+        except (IndexError, TypeError, ValueError): rev = 0
+        try: changements = json.loads(row[1])
+        except (IndexError, ValueError): changements = None
+        return rev, changements
+
+    def _lire_revision(self):
+        return self._lire_changements()[0]
+
+    def _requete_revision(self, rev, changements=()):
+        texte = json.dumps(list(changements), ensure_ascii=False, separators=(",", ":"))
+        return {"updateCells": {
+            "range": {"sheetId": self._feuille_meta().id, "startRowIndex": self.meta[1] - 1,
+                      "endRowIndex": self.meta[1], "startColumnIndex": self.meta[2],
+                      "endColumnIndex": self.meta[2] + 2},
+            "rows": [_ligne([rev, texte])], "fields": "userEnteredValue"}}
+
+    @staticmethod
+    def _resume_ligne(vals):
+        res = dict(zip(COLONNES_RESUME, vals))
+        try: res["niveau"] = int(res["niveau"])
+        except ValueError: pass
+        res["rev"] = _rev(res["rev"])
+        return res
+
+    def _requete_ligne(self, num, valeurs, col_debut=0):
+        return {"updateCells": {
+            "range": {"sheetId": self.sheet.id, "startRowIndex": num - 1, "endRowIndex": num,
+                      "startColumnIndex": col_debut, "endColumnIndex": col_debut + len(valeurs)},
+            "rows": [_ligne(valeurs)], "fields": "userEnteredValue"}}
+
+    @staticmethod
+    def _valeurs(nom, contenu, res):
+        return [nom, contenu] + [res[c] for c in COLONNES_RESUME]
+
+    def _indexer(self, noms, autres):
+        self._nb_lignes = max(len(noms), len(autres))
+        self._index = {}
+        for num in range(2, len(noms) + 1):
+            row = noms[num - 1]
+            if row and row[0]: self._index[row[0]] = num
+
+    def _lire_revisions(self, noms):
+        # Relecture fraîche des noms et révisions : on réindexe au passage
+        col_noms, col_revs = self._appel(self.sheet, "batch_get", ["A:A", "G:G"])
+        return self._revisions(col_noms, col_revs, noms)
+
+    def _revisions(self, col_noms, col_revs, noms):
+        self._indexer(col_noms, col_revs)
+        return {nom: _rev((col_revs[num - 1] or [None])[0] if num - 1 < len(col_revs) else None)
+                for nom, num in self._index.items() if nom in noms}
+
+    def _lire_pour_ecrire(self, noms):
+        # Noms et révisions des lignes, révision et journal : un seul appel, sur deux onglets
+        meta = self._feuille_meta()
+        plages = [_plage(self.sheet.title, "A:A"), _plage(self.sheet.title, "G:G"),
+                  _plage(meta.title, self._cellules_meta())]
+        reponse = self._appel(self.sheet.spreadsheet, "values_batch_get", plages)
+        col_noms, col_revs, vals_meta = [r.get("values", []) for r in reponse["valueRanges"]]
+        return (self._revisions(col_noms, col_revs, noms), *self._decoder_meta(vals_meta))
+
+    def _lire_resumes(self):
+        # Un seul appel, sans la colonne DATA_JSON
+        noms, resumes = self._appel(self.sheet, "batch_get", ["A:A", "C:G"])
+        self._indexer(noms, resumes)
+        lignes, a_migrer = [], []
+        for nom, num in self._index.items():
+            vals = resumes[num - 1] if num - 1 < len(resumes) else []
+            if len(vals) < len(COLONNES_RESUME):
+                a_migrer.append((nom, num))
+                continue
+            lignes.append((nom, self._resume_ligne(vals)))
+        en_tete_ok = bool(resumes) and resumes[0] == EN_TETE[2:]
+        if a_migrer or (self._nb_lignes and not en_tete_ok):
+            lignes += self._migrer(a_migrer)
+        return lignes
+
+    def _migrer(self, a_migrer):
+        # Anciennes lignes sans colonnes de résumé : calculées une fois puis écrites
+        requetes = [self._requete_ligne(1, EN_TETE)]
+        lignes = []
+        if a_migrer:
+            cellules = self._appel(self.sheet, "batch_get", [f"B{num}" for nom, num in a_migrer])
+            for (nom, num), cel in zip(a_migrer, cellules):
+                try: res = resume(decoder(cel[0][0]))
+                except: continue
+                lignes.append((nom, res))
+                requetes.append(self._requete_ligne(num, [res[c] for c in COLONNES_RESUME], 2))
+        self._appel(self.sheet.spreadsheet, "batch_update", {"requests": requetes})
+        return lignes
+
+    def _lire_resumes_de(self, modifies, supprimes):
+        # Suppression ou nouvelle ligne : les numéros ont bougé, relecture complète
+        if supprimes or any(nom not in self._index for nom in modifies): return None
+        nums = [(nom, self._index[nom]) for nom in modifies]
+        vals = self._appel(self.sheet, "batch_get", [p for nom, num in nums for p in (f"A{num}", f"C{num}:G{num}")])
+        resumes = {}
+        for k, (nom, num) in enumerate(nums):
+            cel_nom, res = vals[2 * k], vals[2 * k + 1]
+            if not cel_nom or cel_nom[0][:1] != [nom] or not res or len(res[0]) < len(COLONNES_RESUME):
+                return None  # la ligne n'est plus celle attendue
+            resumes[nom] = self._resume_ligne(res[0])
+        return resumes
+
+    def _lire_perso(self, nom):
+        return self._lire_persos([nom]).get(nom)
+
+    def _lire_persos(self, noms):
+        # Le nom est relu avec le contenu : un index périmé (ligne supprimée
+        # ou ajoutée par une autre instance) ne fait jamais lire le voisin
+        for essai in range(2):
+            nums = [(nom, self._index[nom]) for nom in noms if nom in self._index]
+            if not nums: return {}
+            cellules = self._appel(self.sheet, "batch_get", [f"A{num}:B{num}" for nom, num in nums])
+            contenus, decales = {}, False
+            for (nom, num), cel in zip(nums, cellules):
+                row = cel[0] if cel else []
+                if row[:1] != [nom]: decales = True
+                else: contenus[nom] = row[1] if len(row) > 1 else None
+            if not decales or essai: return contenus
+            self._lire_revisions(())  # réindexe, puis relit une fois
+
+    def _lire_tout(self):
+        records = self._appel(self.sheet, "get_all_values")
+        self._nb_lignes = len(records)
+        return [(row[0], row[1], row[6] if len(row) > 6 else None)
+                for row in records[1:] if len(row) >= 2 and row[0]]
+
+    def _ecrire(self, lignes, supprimes, rev, changements):
+        for nom, (contenu, res) in lignes.items():
+            if len(contenu) > self.LIMITE_CELLULE:
+                raise ValueError(f"{nom} : {len(contenu)} caractères, au-delà de la limite d'une cellule")
+        requetes, nouveaux = [self._requete_revision(rev, changements)], []
+        # 1. Mises à jour en place (numéros de ligne encore valides)
+        for nom, (contenu, res) in lignes.items():
+            num = self._index.get(nom)
+            if num is None:
+                nouveaux.append(nom)
+                continue
+            requetes.append(self._requete_ligne(num, self._valeurs(nom, contenu, res)))
+        # 2. Suppressions du bas vers le haut pour ne pas décaler les suivantes
+        nums_supp = sorted(self._index[nom] for nom in supprimes)
+        for num in reversed(nums_supp):
+            requetes.append({"deleteDimension": {"range": {
+                "sheetId": self.sheet.id, "dimension": "ROWS", "startIndex": num - 1, "endIndex": num}}})
+        # 3. Ajouts en fin de feuille
+        lignes_ajout = [_ligne(self._valeurs(nom, *lignes[nom])) for nom in nouveaux]
+        if lignes_ajout and self._nb_lignes == 0:
+            lignes_ajout.insert(0, _ligne(EN_TETE))
+        if lignes_ajout:
+            requetes.append({"appendCells": {"sheetId": self.sheet.id, "rows": lignes_ajout,
+                                             "fields": "userEnteredValue"}})
+
+        self._appel(self.sheet.spreadsheet, "batch_update", {"requests": requetes})
+
+        # Index à jour sans relire la feuille
+        for nom in supprimes: del self._index[nom]
+        for nom, num in self._index.items():
+            self._index[nom] = num - bisect.bisect_left(nums_supp, num)
+        self._nb_lignes -= len(nums_supp)
+        if lignes_ajout and self._nb_lignes == 0: self._nb_lignes = 1
+        for nom in nouveaux:
+            self._nb_lignes += 1
+            self._index[nom] = self._nb_lignes
+
+    def _reecrire(self, lignes, rev):
+        rows = [EN_TETE] + [self._valeurs(nom, c, res) for nom, (c, res) in lignes.items()]
+        # Pas de clear() : un update qui échoue laisserait une feuille vide.
+        # Les anciennes lignes en trop sont effacées par le même update.
+        vides = [[""] * len(EN_TETE)] * max(0, self._nb_lignes - len(rows))
+        self._appel(self.sheet, "update", rows + vides)
+        self._appel(self.sheet.spreadsheet, "batch_update", {"requests": [self._requete_revision(rev)]})
+        self._index = {row[0]: num for num, row in enumerate(rows[1:], start=2)}
+        self._nb_lignes = len(rows)
+
+
+class Repertoire:
+    """Annuaire des campagnes : nom -> backend de sa partition.
+
+    La campagne DEFAUT est la partition historique (sheet1, dnd.db), elle
+    existe toujours. Les backends sont ouverts à la demande et gardés :
+    chacun a son propre cache et sa propre révision.
+    """
+    DEFAUT = "Principale"
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._verrou = threading.RLock()
+        self._backends = {}
+        self._annuaire = None   # nom -> infos propres au stockage
+        self._annuaire_t = 0.0
+
+    def _lire_annuaire(self): raise NotImplementedError
+    def _ouvrir(self, nom, infos): raise NotImplementedError
+    def _creer(self, nom): raise NotImplementedError
+
+    def _rafraichir(self, forcer=False):
+        if forcer or self._annuaire is None or time.monotonic() - self._annuaire_t > self.ttl:
+            self._annuaire = self._lire_annuaire()
+            self._annuaire_t = time.monotonic()
+
+    def campagnes(self):
+        with self._verrou:
+            self._rafraichir()
+            return [self.DEFAUT] + [nom for nom in self._annuaire if nom != self.DEFAUT]
+
+    def backend(self, nom):
+        with self._verrou:
+            if nom not in self._backends:
+                infos = None
+                if nom != self.DEFAUT:
+                    self._rafraichir()
+                    if nom not in self._annuaire: self._rafraichir(forcer=True)  # créée par une autre instance
+                    if nom not in self._annuaire: raise KeyError(nom)
+                    infos = self._annuaire[nom]
+                self._backends[nom] = self._ouvrir(nom, infos)
+            return self._backends[nom]
+
+    def creer(self, nom):
+        nom = nom.strip()
+        with self._verrou:
+            self._rafraichir(forcer=True)
+            if not nom or nom.startswith("_") or nom == self.DEFAUT or nom in self._annuaire:
+                raise ValueError(f"Nom de campagne invalide ou déjà pris : {nom!r}")
+            self._creer(nom)
+            self._rafraichir(forcer=True)
+            return self.backend(nom)
+
+
+class RepertoireMemoire(Repertoire):
+    def __init__(self, data=None, ttl=60):
+        super().__init__(ttl)
+        self._data = data or {}   # campagne -> {nom: perso}
+        self._noms = [nom for nom in self._data if nom != self.DEFAUT]
+
+    def _lire_annuaire(self):
+        return {nom: None for nom in self._noms}
+
+    def _ouvrir(self, nom, infos):
+        return BackendMemoire(self._data.get(nom), ttl=self.ttl)
+
+    def _creer(self, nom):
+        self._noms.append(nom)
+
+
+class RepertoireSQLite(Repertoire):
+    """Un fichier par campagne à côté du fichier principal, annuaire dans ce dernier."""
+    def __init__(self, chemin="dnd.db", ttl=60):
+        super().__init__(ttl)
+        self.chemin = Path(chemin)
+        self.conn = sqlite3.connect(chemin, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS campagnes (nom TEXT PRIMARY KEY, chemin TEXT NOT NULL)")
+        self.conn.commit()
+
+    def _lire_annuaire(self):
+        return dict(self.conn.execute("SELECT nom, chemin FROM campagnes ORDER BY rowid"))
+
+    def _ouvrir(self, nom, infos):
+        return BackendSQLite(str(self.chemin) if infos is None else infos, ttl=self.ttl)
+
+    def _creer(self, nom):
+        with self.conn:
+            (n,), = self.conn.execute("SELECT COALESCE(MAX(rowid), 0) + 1 FROM campagnes")
+            chemin = self.chemin.with_name(f"{self.chemin.stem}-{n}{self.chemin.suffix}")
+            self.conn.execute("INSERT INTO campagnes (nom, chemin) VALUES (?, ?)", (nom, str(chemin)))
+
+
+class RepertoireSheets(Repertoire):
+    """Un onglet par campagne ; annuaire dans l'onglet "_campagnes".
+
+    Une ligne par campagne : CAMPAGNE | ONGLET | REV | CHANGEMENTS. REV et
+    CHANGEMENTS servent de cellules de révision au backend de la campagne (les lignes ne bougent
+    pas : on ne supprime pas de campagne).
+    """
+    FEUILLE = "_campagnes"
+    EN_TETE = ["CAMPAGNE", "ONGLET", "REV", "CHANGEMENTS"]
+
+    def __init__(self, spreadsheet, ttl=60):
+        super().__init__(ttl)
+        self.spreadsheet = spreadsheet
+        self._feuille = None
+
+    def _annuaire_feuille(self, creer=False):
+        if self._feuille is None:
+            try: self._feuille = BackendSheets._appel(self.spreadsheet, "worksheet", self.FEUILLE)
+            except Exception:
+                if not creer: return None
+                self._feuille = BackendSheets._appel(self.spreadsheet, "add_worksheet", self.FEUILLE, rows=1, cols=len(self.EN_TETE))
+        return self._feuille
+
+    def _lire_annuaire(self):
+        feuille = self._annuaire_feuille()
+        if feuille is None: return {}
+        lignes = BackendSheets._appel(feuille, "get_all_values")
+        return {row[0]: (row[1], num) for num, row in enumerate(lignes, start=1)
+                if num > 1 and len(row) >= 2 and row[0]}
+
+    def _ouvrir(self, nom, infos):
+        if infos is None: return BackendSheets(self.spreadsheet.sheet1, ttl=self.ttl)
+        onglet, num = infos
+        sheet = BackendSheets._appel(self.spreadsheet, "worksheet", onglet)
+        return BackendSheets(sheet, ttl=self.ttl, meta=(self.FEUILLE, num, 2))
+
+    def _creer(self, nom):
+        feuille = self._annuaire_feuille(creer=True)
+        BackendSheets._appel(self.spreadsheet, "add_worksheet", nom, rows=100, cols=len(EN_TETE))
+        lignes = [_ligne([nom, nom, 0])]
+        if not self._annuaire and not BackendSheets._appel(feuille, "get_all_values"):
+            lignes.insert(0, _ligne(self.EN_TETE))
+        BackendSheets._appel(self.spreadsheet, "batch_update", {"requests": [{"appendCells": {
+            "sheetId": feuille.id, "rows": lignes, "fields": "userEnteredValue"}}]})
+
+
+class FileSauvegarde:
+    """File d'écriture différée, partagée par toutes les sessions.
+
+    Les entrées sont indexées par (nom, session) : deux sessions qui
+    sauvegardent le même personnage ne s'écrasent pas dans la file, le
+    backend les applique l'une après l'autre avec contrôle de révision.
+
+    statuts : (nom, session) -> (etat, message, heure) avec etat parmi
+    "en_attente", "en_cours", "ok", "fusion", "conflit", "echec".
+    resultats : (nom, session) -> résultat de ecrire_versions, complété de
+    "soumis" (l'instantané envoyé) et "base" ; récupéré par la session.
+    Statuts, résultats et échecs terminés sont oubliés après `garde`
+    secondes : une session fermée ne laisse rien derrière elle.
+    """
+    def __init__(self, backend, delai=0.5, essais_max=6, attente_initiale=1.0, garde=3600, demarrer=True):
+        self.backend = backend
+        self.delai = delai                  # laisse les clics rapprochés se regrouper
+        self.essais_max = essais_max
+        self.attente_initiale = attente_initiale
+        self.garde = garde
+        self._cond = threading.Condition()
+        self._attente = {}                  # (nom, session) -> (data, base, modifs) ; data None = suppression
+        self._echecs = {}                   # idem, gardé pour "Réessayer"
+        self._en_vol = {}                   # lot en cours d'écriture
+        self.statuts = {}
+        self.resultats = {}
+        self._termines = {}                 # (nom, session) -> instant (monotonic) du dernier état final
+        # demarrer=False : pas de thread, les lots sont envoyés à la main (tests)
+        if demarrer: threading.Thread(target=self._boucle, daemon=True, name="file-sauvegarde").start()
+
+    def soumettre(self, nom, data, session=None, base=None, modifs=None):
+        # data doit être un instantané que l'appelant ne modifie plus (Perso.vers_dict())
+        self._poser((nom, session), (data, base, modifs))
+
+    def supprimer(self, nom, session=None, base=None):
+        self._poser((nom, session), (None, base, None))
+
+    def reessayer(self, nom, session=None):
+        with self._cond:
+            cle = (nom, session)
+            if cle in self._echecs: self._poser(cle, self._echecs.pop(cle))
+
+    def _poser(self, cle, entree):
+        with self._cond:
+            self._attente[cle] = entree
+            self._echecs.pop(cle, None)
+            self.resultats.pop(cle, None)
+            self.statuts[cle] = ("en_attente", "", horodatage())
+            self._termines.pop(cle, None)
+            self._cond.notify()
+
+    def statut(self, nom, session=None):
+        with self._cond:
+            return self.statuts.get((nom, session))
+
+    def resultat(self, nom, session=None):
+        """Résultat de la dernière écriture de cette session (retiré au passage)."""
+        with self._cond:
+            return self.resultats.pop((nom, session), None)
+
+    def apercu(self, session=None):
+        """Écritures de cette session pas encore confirmées (nom -> data ou None), pour l'affichage."""
+        with self._cond:
+            tout = {**self._echecs, **self._en_vol, **self._attente}
+            return {nom: data for (nom, s), (data, base, modifs) in tout.items() if s == session}
+
+    def lire(self, nom, session=None):
+        """Copie (data, base) de la dernière version soumise par cette session et pas encore écrite."""
+        with self._cond:
+            cle = (nom, session)
+            entree = self._attente.get(cle) or self._en_vol.get(cle) or self._echecs.get(cle)
+        if entree is None or entree[0] is None: return None
+        return json.loads(json.dumps(entree[0], ensure_ascii=False)), entree[1]
+
+    def vider(self, timeout=None):
+        """Attend que tout soit écrit (tests, arrêt propre)."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._attente and not self._en_vol, timeout)
+
+    @staticmethod
+    def _rebaser(entree, res):
+        # Sans ça, la version suivante de la même session entrerait en
+        # conflit avec la précédente, écrite entre-temps
+        data, base, modifs = entree
+        if res["etat"] == "conflit" or base is None: return entree
+        if res["etat"] == "fusion" and data is not None:
+            # La fusion a apporté des champs d'une autre session : on les reprend
+            if base[1] is None: return entree
+            if modifs is not None: data, conflits = appliquer_modifs(base[1], data, modifs, res["data"])
+            else: data, conflits = fusionner(base[1], data, res["data"])
+            if conflits: return entree
+        return data, (res["rev"], res["data"]), modifs
+
+    def _terminer(self, cle, etat, message=""):
+        # Appelé sous self._cond
+        self.statuts[cle] = (etat, message, horodatage())
+        self._termines[cle] = time.monotonic()
+
+    def _purger(self):
+        # Appelé sous self._cond : oublie ce qu'aucune session n'est venue chercher
+        limite = time.monotonic() - self.garde
+        for cle in [cle for cle, t in self._termines.items() if t < limite]:
+            del self._termines[cle]
+            for d in (self.statuts, self.resultats, self._echecs): d.pop(cle, None)
+
+    def _boucle(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._attente)
+                self._purger()
+            time.sleep(self.delai)
+            self._envoyer(self._prendre_lot())
+
+    def _prendre_lot(self):
+        with self._cond:
+            lot, self._attente = self._attente, {}
+            self._en_vol = lot
+            for cle in lot: self.statuts[cle] = ("en_cours", "", horodatage())
+        return lot
+
+    def _envoyer(self, lot):
+        attente = self.attente_initiale
+        for essai in range(self.essais_max):
+            cles = list(lot)
+            try:
+                with perf.chrono("ecriture_lot"):
+                    resultats = self.backend.ecrire_versions([(nom, *lot[(nom, s)]) for nom, s in cles])
+            except Exception as e:
+                dernier = not erreur_temporaire(e) or essai == self.essais_max - 1
+                with self._cond:
+                    for cle in lot:
+                        if dernier: self._terminer(cle, "echec", str(e))
+                        else: self.statuts[cle] = ("en_attente", str(e), horodatage())
+                    if dernier:
+                        self._echecs.update(lot)
+                        self._en_vol = {}
+                        self._cond.notify_all()
+                        return
+                time.sleep(attente)
+                attente *= 2
+                # Les versions soumises pendant l'attente remplacent celles du lot
+                with self._cond:
+                    lot.update(self._attente)
+                    self._attente = {}
+                continue
+            with self._cond:
+                for cle, res in zip(cles, resultats):
+                    if cle in self._attente:
+                        # Une version plus récente attend déjà : elle part de celle-ci
+                        self._attente[cle] = self._rebaser(self._attente[cle], res)
+                        continue
+                    res["soumis"], res["base"], _ = lot[cle]
+                    self.resultats[cle] = res
+                    self._terminer(cle, res["etat"])
+                self._en_vol = {}
+                self._cond.notify_all()
+            return
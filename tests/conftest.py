@@ -0,0 +1,8 @@
+import sys
+from pathlib import Path
+
+# Les modules de l'app sont à la racine du dépôt, sans paquet ; le faux
+# Google Sheets des benchmarks sert aussi aux tests
+RACINE = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RACINE))
+sys.path.insert(0, str(RACINE / "bench"))
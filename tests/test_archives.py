@@ -0,0 +1,49 @@
+import io
+
+import pytest
+
+import archives
+from stockage import BackendMemoire
+
+
+def perso(nom, xp=0):
+    return {"infos": {"nom": nom}, "xp": xp, "features": {}, "items": {}}
+
+
+@pytest.fixture
+def backend():
+    return BackendMemoire({"A": perso("A"), "B": perso("B")})
+
+
+def test_export_import(backend):
+    flux = io.StringIO()
+    assert archives.exporter(backend, flux, lot=1) == 2
+    copie = BackendMemoire()
+    assert archives.importer(copie, archives._lignes(io.StringIO(flux.getvalue())), lot=1) == (2, 0)
+    assert copie.charger_persos(["A", "B"]) == backend.charger_persos(["A", "B"])
+
+
+def test_restaurer_revient_a_linstantane(backend, tmp_path):
+    archives.instantane(backend, tmp_path)
+    backend.appliquer({"C": perso("C"), "A": perso("A", 5)}, ["B"])
+    assert archives.restaurer(backend, tmp_path) == (2, 1)
+    assert sorted(backend.charger_index(0)) == ["A", "B"]
+    assert backend.charger_perso("A")[0]["xp"] == 0
+
+
+def test_restaurer_dossier_absent_ne_touche_rien(backend, tmp_path):
+    with pytest.raises(archives.ChaineIncomplete):
+        archives.restaurer(backend, tmp_path / "nexistepas")
+    assert sorted(backend.charger_index(0)) == ["A", "B"]
+
+
+def test_restaurer_sans_complet_ne_touche_rien(backend, tmp_path):
+    archives.instantane(backend, tmp_path)
+    backend.appliquer({"C": perso("C")}, [])
+    archives.instantane(backend, tmp_path)
+    for f in tmp_path.glob("*-complet.jsonl"): f.unlink()
+    with pytest.raises(archives.ChaineIncomplete):
+        archives.restaurer(backend, tmp_path)
+    with pytest.raises(archives.ChaineIncomplete):
+        archives.restaurer(backend, tmp_path, jusqua="20000101-000000")
+    assert sorted(backend.charger_index(0)) == ["A", "B", "C"]
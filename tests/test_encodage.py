@@ -0,0 +1,80 @@
+import json
+
+import pytest
+
+from encodage import CHAMPS_FEATURE, SEUIL_COMPRESSION, decoder, encoder, migrer
+
+
+def perso_v1():
+    # Forme historique : compétences et objets en listes positionnelles
+    return {
+        "infos": {"nom": "Aria", "race": "Elfe", "classe": "Magicien", "niveau": 3},
+        "xp": 900,
+        "hp": {"max": 18, "actuel": 12, "temp": 0},
+        "hit_dice_used": 1,
+        "features": [
+            {"nom": "Récupération arcanique", "max": 1, "actuel": 1, "repos": "Long", "linked_pb": False},
+            {"nom": "Inspiration", "max": 2, "actuel": 0, "repos": "Court", "linked_pb": True},
+        ],
+        "items": [{"nom": "Potion", "max": 3, "actuel": 2, "repos": "Jamais"}],
+        "spells_active": True,
+        "spells": {str(i): {"max": 4 if i == 1 else 0, "actuel": 2 if i == 1 else 0} for i in range(1, 10)},
+    }
+
+
+def test_v1_migre_en_collections_a_ids():
+    perso = decoder(json.dumps(perso_v1(), ensure_ascii=False))
+    assert perso["features"]["0"]["nom"] == "Récupération arcanique"
+    assert perso["ordre"] == {"features": ["0", "1"], "items": ["0"]}
+
+
+def test_v2_lu_comme_v1():
+    v1 = perso_v1()
+    compact = {"i": ["Aria", "Elfe", "Magicien", 3], "x": 900, "h": [18, 12, 0], "d": 1,
+               "f": [[f[c] for c in CHAMPS_FEATURE] for f in v1["features"]],
+               "o": [["Potion", 3, 2, "Jamais"]], "a": True,
+               "s": [[4, 2]] + [[0, 0]] * 8}
+    assert decoder("2:" + json.dumps(compact, ensure_ascii=False)) == decoder(json.dumps(v1, ensure_ascii=False))
+
+
+@pytest.mark.parametrize("cellule", [
+    lambda p: json.dumps(p, ensure_ascii=False),   # v1
+    lambda p: encoder(p),                           # v3 depuis les listes
+    lambda p: encoder(migrer(dict(p))),             # v3 depuis les collections
+])
+def test_aller_retour_v3(cellule):
+    perso = decoder(cellule(perso_v1()))
+    texte = encoder(perso)
+    assert texte.startswith("3:")
+    assert decoder(texte) == perso
+
+
+def test_ordre_et_ids_conserves():
+    perso = migrer(perso_v1())
+    perso["features"]["b7"] = {"nom": "Ajoutée", "max": 1, "actuel": 1, "repos": "Long", "linked_pb": False}
+    perso["ordre"]["features"] = ["b7", "1", "0"]
+    relu = decoder(encoder(perso))
+    assert relu["ordre"]["features"] == ["b7", "1", "0"]
+    assert relu["features"]["b7"]["nom"] == "Ajoutée"
+
+
+def test_enregistrement_hors_schema_garde_tel_quel():
+    perso = migrer(perso_v1())
+    perso["features"]["0"]["note"] = "champ libre"
+    perso["autre_cle"] = {"x": 1}
+    assert decoder(encoder(perso)) == perso
+
+
+def test_compression_au_dela_du_seuil():
+    perso = migrer(perso_v1())
+    for i in range(SEUIL_COMPRESSION // 20):
+        perso["items"][f"i{i}"] = {"nom": "Flèche", "max": 20, "actuel": 20, "repos": "Jamais"}
+        perso["ordre"]["items"].append(f"i{i}")
+    texte = encoder(perso)
+    assert texte.startswith("3z:")
+    assert decoder(texte) == perso
+
+
+def test_version_inconnue():
+    with pytest.raises(ValueError):
+        decoder("9:{}")
@@ -0,0 +1,57 @@
+import copy
+
+import pytest
+
+from journal import Journal, modifs_finales, rejouer
+from stockage import BackendMemoire, FileSauvegarde
+
+from test_stockage import perso
+
+
+@pytest.fixture
+def monde(tmp_path):
+    backend = BackendMemoire({"Aria": perso()})
+    journal = Journal(tmp_path, inactivite=3600)
+    journal.brancher("c", FileSauvegarde(backend, demarrer=False))
+    data, rev = backend.charger_perso("Aria")
+    journal.ouvrir("s", "c", "Aria", (rev, data))
+    return backend, journal, (rev, data)
+
+
+def ecrire_ailleurs(backend, base, **champs):
+    autre = copy.deepcopy(base[1])
+    autre.update(champs)
+    res, = backend.ecrire_versions([("Aria", autre, base)])
+    assert res["etat"] == "ok"
+
+
+def test_etat_porte_la_base(monde):
+    backend, journal, base = monde
+    journal.ajouter("s", ["xp"], 10)
+    etat = journal.etat("s")
+    assert etat["base"] == base and etat["modifs"] == [(["xp"], 10)]
+
+
+def test_modifs_finales_parents_dabord():
+    data, _ = rejouer(perso(), [(["features", "a", "actuel"], 0), (["features"], {}), (["xp"], 5)])
+    assert modifs_finales(data, [(["features", "a", "actuel"], 0), (["features"], {}), (["xp"], 5)]) == \
+        {("features",): {}, ("xp",): 5}
+    assert modifs_finales(data, [([], data)]) is None
+
+
+def test_repli_fusionne_une_ecriture_concurrente(monde):
+    backend, journal, base = monde
+    ecrire_ailleurs(backend, base, xp=300)
+    journal.ajouter("s", ["hp", "actuel"], 5)
+    rev, data = journal._replier("s", journal.etat("s"))
+    assert data["xp"] == 300 and data["hp"]["actuel"] == 5
+    assert backend.charger_perso("Aria") == (data, rev)
+
+
+def test_repli_en_conflit_ne_touche_a_rien(monde):
+    backend, journal, base = monde
+    ecrire_ailleurs(backend, base, xp=300)
+    journal.ajouter("s", ["xp"], 100)
+    stocke = backend.charger_perso("Aria")
+    assert journal._replier("s", journal.etat("s")) == "garder"
+    assert backend.charger_perso("Aria") == stocke
@@ -0,0 +1,92 @@
+import pytest
+
+import faux_sheet
+from stockage import BackendSheets, decoder
+
+from test_stockage import perso
+
+
+@pytest.fixture
+def ss():
+    return faux_sheet.FauxSpreadsheet()
+
+
+def noms(ss):
+    # Dans l'ordre de la feuille, lignes vides finales omises comme par l'API
+    return [row[0] if row else "" for row in faux_sheet._rogner(ss.sheet1.lignes)[1:]]
+
+
+def lignes(ss):
+    return {row[0]: decoder(row[1]) for row in ss.sheet1.lignes[1:] if row and row[0]}
+
+
+# --- plusieurs instances sur la même feuille ---
+
+def test_ecriture_part_de_la_revision_stockee(ss):
+    app, autre = BackendSheets(ss.sheet1), BackendSheets(ss.sheet1)
+    app.appliquer({"Aria": perso()}, [])
+    app.charger_index()
+    autre.appliquer({"Brann": perso("Brann")}, [])
+    app.appliquer({"Cyra": perso("Cyra")}, [])
+    assert app.revision == autre.revision + 1
+    assert set(app.charger_index()) == {"Aria", "Brann", "Cyra"}
+    assert lignes(ss) == {"Aria": perso(), "Brann": perso("Brann"), "Cyra": perso("Cyra")}
+
+
+def test_lecture_apres_suppression_ailleurs(ss):
+    app, autre = BackendSheets(ss.sheet1), BackendSheets(ss.sheet1)
+    app.appliquer({"Aria": perso(), "Brann": perso("Brann"), "Cyra": perso("Cyra")}, [])
+    autre.charger_index()
+    app.appliquer({}, ["Aria"])
+    # Index de l'autre instance périmé : Brann est remonté d'une ligne
+    assert autre.charger_perso("Brann")[0] == perso("Brann")
+    autre.appliquer({"Cyra": perso("Cyra", xp=5)}, [])
+    assert lignes(ss) == {"Brann": perso("Brann"), "Cyra": perso("Cyra", xp=5)}
+
+
+# --- écritures groupées ---
+
+def test_suppressions_et_ajouts_dans_le_meme_lot(ss):
+    b = BackendSheets(ss.sheet1)
+    b.appliquer({nom: perso(nom) for nom in ("Aria", "Brann", "Cyra", "Dara")}, [])
+    ss.compteur.reinitialiser()
+    b.appliquer({"Eris": perso("Eris"), "Cyra": perso("Cyra", xp=7)}, ["Aria", "Dara"])
+    assert ss.compteur.appels["batch_update"] == 1
+    assert noms(ss) == ["Brann", "Cyra", "Eris"]
+    assert lignes(ss) == {"Brann": perso("Brann"), "Cyra": perso("Cyra", xp=7), "Eris": perso("Eris")}
+    # Index tenu à jour sans relecture : l'écriture suivante vise les bonnes lignes
+    assert b._index == {"Brann": 2, "Cyra": 3, "Eris": 4}
+    b.appliquer({"Eris": perso("Eris", xp=1)}, ["Brann"])
+    assert lignes(ss) == {"Cyra": perso("Cyra", xp=7), "Eris": perso("Eris", xp=1)}
+
+
+def test_compactage_retrecit_la_feuille(ss):
+    b = BackendSheets(ss.sheet1)
+    b.appliquer({"Aria": perso(), "Brann": perso("Brann")}, [])
+    # Ligne vidée à la main et doublon : le compactage n'en garde qu'une par nom
+    ss.sheet1.lignes.insert(2, [])
+    ss.sheet1.lignes.append(list(ss.sheet1.lignes[1]))
+    b.compacter()
+    assert noms(ss) == ["Aria", "Brann"]
+    autre = BackendSheets(ss.sheet1)
+    assert set(autre.charger_index()) == {"Aria", "Brann"}
+    assert autre.revision == b.revision
+    b.appliquer({"Cyra": perso("Cyra")}, [])
+    assert noms(ss) == ["Aria", "Brann", "Cyra"]
+
+
+# --- journal des changements ---
+
+def test_lignes_deplacees_relecture_complete(ss):
+    app, autre = BackendSheets(ss.sheet1), BackendSheets(ss.sheet1)
+    app.appliquer({"Aria": perso(), "Brann": perso("Brann")}, [])
+    autre.charger_index()
+    assert autre._lire_resumes_de(["Aria"], [])["Aria"]["classe"] == "Magicien"
+    assert autre._lire_resumes_de(["Cyra"], []) is None     # nouvelle ligne : numéro inconnu
+    assert autre._lire_resumes_de(["Aria"], ["Brann"]) is None  # suppression : lignes décalées
+    app.appliquer({}, ["Aria"])
+    # Index périmé : la ligne attendue porte un autre nom
+    assert autre._lire_resumes_de(["Brann"], []) is None
+    autre._cache_t = 0
+    assert set(autre.charger_index()) == {"Brann"}
+    assert autre.charger_perso("Brann")[0] == perso("Brann")
@@ -0,0 +1,280 @@
+import copy
+
+import pytest
+
+import stockage
+from stockage import BackendMemoire, BackendSQLite, FileSauvegarde, _noter_changement, appliquer_modifs, fusionner
+
+
+def perso(nom="Aria", **champs):
+    data = {"infos": {"nom": nom, "classe": "Magicien", "niveau": 3}, "xp": 0,
+            "hp": {"max": 18, "actuel": 18, "temp": 0},
+            "features": {"a": {"nom": "Inspiration", "max": 2, "actuel": 2}},
+            "items": {}, "ordre": {"features": ["a"], "items": []}}
+    data.update(champs)
+    return data
+
+
+# --- fusion des ordres ---
+
+@pytest.mark.parametrize("base, mine, theirs, attendu", [
+    (["a", "b", "c"], ["a", "b", "c", "d"], ["a", "b", "c", "e"], ["a", "b", "c", "d", "e"]),  # deux ajouts
+    (["a", "b", "c"], ["c", "a", "b"], ["a", "b", "c", "e"], ["c", "a", "b", "e"]),            # réordonné + ajout
+    (["a", "b", "c"], ["a", "b", "c"], ["b", "a", "c"], ["b", "a", "c"]),                      # l'autre seul réordonne
+    (["a", "b", "c"], ["a", "c"], ["c", "b", "a"], ["a", "c"]),                                # gagnant gardé, sans le supprimé
+    (["a", "b"], ["a", "b", "d"], ["b"], ["b", "d"]),                                          # suppression + ajout
+])
+def test_fusion_ordre(base, mine, theirs, attendu):
+    fusion, conflits = fusionner({"ordre": {"features": base}}, {"ordre": {"features": mine}},
+                                 {"ordre": {"features": theirs}})
+    assert fusion["ordre"]["features"] == attendu
+    assert conflits == []
+
+
+def test_fusion_ordre_gagnant_theirs():
+    fusion, _ = fusionner({"ordre": {"f": ["a", "b"]}}, {"ordre": {"f": ["b", "a"]}},
+                          {"ordre": {"f": ["c", "b", "a"]}}, gagnant="theirs")
+    assert fusion["ordre"]["f"] == ["c", "b", "a"]
+
+
+def test_liste_hors_ordre_atomique():
+    _, conflits = fusionner({"x": [1]}, {"x": [1, 2]}, {"x": [1, 3]})
+    assert conflits == [("x",)]
+
+
+# --- fusion champ par champ ---
+
+def test_fusion_champs_distincts():
+    base = perso()
+    mine, theirs = copy.deepcopy(base), copy.deepcopy(base)
+    mine["hp"]["actuel"] = 10
+    theirs["xp"] = 300
+    fusion, conflits = fusionner(base, mine, theirs)
+    assert conflits == []
+    assert fusion["hp"]["actuel"] == 10 and fusion["xp"] == 300
+
+
+def test_conflit_meme_champ():
+    base = perso()
+    mine, theirs = copy.deepcopy(base), copy.deepcopy(base)
+    mine["xp"], theirs["xp"] = 100, 200
+    for gagnant, attendu in (("mine", 100), ("theirs", 200)):
+        fusion, conflits = fusionner(base, mine, theirs, gagnant)
+        assert conflits == [("xp",)] and fusion["xp"] == attendu
+
+
+def test_appliquer_modifs_comme_fusionner():
+    base = perso()
+    mine, theirs = copy.deepcopy(base), copy.deepcopy(base)
+    mine["hp"]["actuel"] = 10
+    mine["features"]["b"] = {"nom": "Second souffle", "max": 1, "actuel": 1}
+    mine["ordre"]["features"].append("b")
+    theirs["xp"] = 300
+    theirs["items"]["p"] = {"nom": "Potion", "max": 1, "actuel": 1}
+    theirs["ordre"]["items"].append("p")
+    modifs = {("hp", "actuel"): 10, ("features", "b"): mine["features"]["b"],
+              ("ordre", "features"): mine["ordre"]["features"]}
+    assert appliquer_modifs(base, mine, modifs, theirs) == fusionner(base, mine, theirs)
+
+
+def test_appliquer_modifs_parent_supprime_repris_entier():
+    base = perso()
+    mine, theirs = copy.deepcopy(base), copy.deepcopy(base)
+    mine["features"]["a"]["actuel"] = 0
+    del theirs["features"]["a"]
+    final, conflits = appliquer_modifs(base, mine, {("features", "a", "actuel"): 0}, theirs)
+    assert final["features"]["a"] == mine["features"]["a"]
+    assert conflits == [("features", "a", "actuel")]
+
+
+# --- écritures conditionnelles ---
+
+@pytest.fixture(params=["memoire", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memoire": return BackendMemoire({"Aria": perso()})
+    b = BackendSQLite(tmp_path / "dnd.db")
+    b.appliquer({"Aria": perso()}, [])
+    return b
+
+
+def charger(backend, nom="Aria"):
+    data, rev = backend.charger_perso(nom)
+    return rev, data
+
+
+def test_ecriture_a_jour(backend):
+    rev, data = charger(backend)
+    mine = copy.deepcopy(data)
+    mine["xp"] = 50
+    res, = backend.ecrire_versions([("Aria", mine, (rev, data))])
+    assert res["etat"] == "ok" and res["rev"] == rev + 1
+    assert charger(backend) == (rev + 1, mine)
+
+
+@pytest.mark.parametrize("avec_modifs", [False, True])
+def test_fusion_sur_version_plus_recente(backend, avec_modifs):
+    rev, data = charger(backend)
+    autre = copy.deepcopy(data)
+    autre["xp"] = 300
+    backend.ecrire_versions([("Aria", autre, (rev, data))])
+    mine = copy.deepcopy(data)
+    mine["hp"]["actuel"] = 5
+    ecriture = ("Aria", mine, (rev, data)) + (({("hp", "actuel"): 5},) if avec_modifs else ())
+    res, = backend.ecrire_versions([ecriture])
+    assert res["etat"] == "fusion" and res["rev"] == rev + 2
+    assert res["data"]["xp"] == 300 and res["data"]["hp"]["actuel"] == 5
+    assert charger(backend) == (rev + 2, res["data"])
+
+
+@pytest.mark.parametrize("avec_modifs", [False, True])
+def test_conflit_rien_ecrit(backend, avec_modifs):
+    rev, data = charger(backend)
+    autre = copy.deepcopy(data)
+    autre["xp"] = 300
+    backend.ecrire_versions([("Aria", autre, (rev, data))])
+    mine = copy.deepcopy(data)
+    mine["xp"] = 100
+    ecriture = ("Aria", mine, (rev, data)) + (({("xp",): 100},) if avec_modifs else ())
+    res, = backend.ecrire_versions([ecriture])
+    assert res["etat"] == "conflit" and res["conflits"] == [("xp",)]
+    assert res["data"] == autre and res["rev"] == rev + 1
+    assert charger(backend) == (rev + 1, autre)
+
+
+def test_supprime_ailleurs(backend):
+    rev, data = charger(backend)
+    backend.ecrire_versions([("Aria", None, (rev, data))])
+    res, = backend.ecrire_versions([("Aria", perso(xp=1), (rev, data))])
+    assert res["etat"] == "conflit" and res["conflits"] == [()] and res["data"] is None
+
+
+def test_creation_deja_prise(backend):
+    res, = backend.ecrire_versions([("Aria", perso(xp=1), (0, {}))])
+    assert res["etat"] != "ok"
+
+
+def test_lot_meme_perso_enchaine(backend):
+    rev, data = charger(backend)
+    un, deux = perso(xp=10), perso(xp=20)
+    res = backend.ecrire_versions([("Aria", un, (rev, data)), ("Aria", deux, (rev + 1, un))])
+    assert [r["etat"] for r in res] == ["ok", "ok"]
+    assert charger(backend) == (rev + 2, deux)
+
+
+# --- file d'écriture ---
+
+def test_version_suivante_rebasee_sur_lecriture_en_vol(backend):
+    fs = FileSauvegarde(backend, essais_max=1, demarrer=False)
+    rev, data = charger(backend)
+    un = perso(xp=10)
+    deux = perso(xp=10, hp={"max": 18, "actuel": 3, "temp": 0})
+    fs.soumettre("Aria", un, "s", (rev, data), {("xp",): 10})
+    en_vol = fs._prendre_lot()
+    # Sauvegardée pendant l'écriture de la première, depuis la même base
+    fs.soumettre("Aria", deux, "s", (rev, data), {("xp",): 10, ("hp", "actuel"): 3})
+    fs._envoyer(en_vol)
+    assert fs.resultat("Aria", "s") is None  # la version en attente rendra le résultat
+    fs._envoyer(fs._prendre_lot())
+    res = fs.resultat("Aria", "s")
+    assert res["etat"] == "ok"
+    assert charger(backend) == (rev + 2, deux)
+
+
+def test_apercu_de_la_seule_session(backend):
+    fs = FileSauvegarde(backend, demarrer=False)
+    fs.soumettre("Aria", perso(xp=1), "s1")
+    fs.supprimer("Aria", "s2")
+    assert fs.apercu("s1") == {"Aria": perso(xp=1)}
+    assert fs.apercu("s2") == {"Aria": None}
+    assert fs.apercu("s3") == {}
+
+
+@pytest.mark.parametrize("cellule", ["4:{\"nouveau\":1}", "{tronqué"])
+def test_compacter_garde_les_lignes_illisibles(tmp_path, cellule):
+    b = BackendSQLite(tmp_path / "dnd.db")
+    b.appliquer({"Aria": perso()}, [])
+    b.conn.execute("INSERT INTO persos (nom, data, classe, niveau, pv, maj, rev) VALUES ('Futur', ?, '', '', '', '', 3)",
+                   (cellule,))
+    b.conn.commit()
+    b.compacter()
+    assert b.conn.execute("SELECT data, rev FROM persos WHERE nom = 'Futur'").fetchone() == (cellule, 3)
+    assert b.charger_index(0)["Futur"]["classe"] == ""
+    assert b.charger_perso("Aria")[0] == perso()
+
+
+# --- plusieurs instances sur le même stockage ---
+
+def test_ecriture_part_de_la_revision_stockee(tmp_path):
+    app, cli = BackendSQLite(tmp_path / "dnd.db"), BackendSQLite(tmp_path / "dnd.db")
+    app.appliquer({"Aria": perso()}, [])
+    assert app.charger_index()["Aria"]["rev"] == 1
+    cli.appliquer({"Brann": perso("Brann")}, [])
+    rev_cli = cli.revision
+    # Cache de l'app encore frais (ttl) : l'écriture relit quand même la révision
+    app.appliquer({"Cyra": perso("Cyra")}, [])
+    assert app.revision == rev_cli + 1
+    assert set(app.charger_index()) == {"Aria", "Brann", "Cyra"}
+    cli._cache_t = 0
+    assert set(cli.charger_index()) == {"Aria", "Brann", "Cyra"}
+
+
+# --- journal des changements ---
+
+@pytest.fixture
+def lecteur(tmp_path):
+    # Instance qui suit les écritures d'une autre ; compte ses relectures complètes
+    ecrivain = BackendSQLite(tmp_path / "dnd.db")
+    ecrivain.appliquer({"Aria": perso()}, [])
+    b = BackendSQLite(tmp_path / "dnd.db")
+    b.charger_index()
+    b.relectures = 0
+    lire = b._lire_resumes
+    def compter():
+        b.relectures += 1
+        return lire()
+    b._lire_resumes = compter
+    return b, ecrivain
+
+
+def relire(b):
+    b._cache_t = 0
+    return b.charger_index()
+
+
+def test_changements_relus_ligne_a_ligne(lecteur):
+    b, ecrivain = lecteur
+    ecrivain.appliquer({"Brann": perso("Brann")}, [])
+    ecrivain.appliquer({"Aria": perso(xp=5)}, [])
+    assert set(relire(b)) == {"Aria", "Brann"} and b.relectures == 0
+    ecrivain.appliquer({}, ["Brann"])
+    assert set(relire(b)) == {"Aria"} and b.relectures == 0
+    assert b.charger_perso("Aria")[0] == perso(xp=5)
+
+
+def test_trou_dans_le_journal_relecture_complete(lecteur, monkeypatch):
+    b, ecrivain = lecteur
+    monkeypatch.setattr(stockage, "CHANGEMENTS_MAX", 1)
+    ecrivain.appliquer({"Brann": perso("Brann")}, [])
+    ecrivain.appliquer({"Cyra": perso("Cyra")}, [])
+    assert set(relire(b)) == {"Aria", "Brann", "Cyra"} and b.relectures == 1
+
+
+def test_ecriture_sans_noms_relecture_complete(lecteur, monkeypatch):
+    b, ecrivain = lecteur
+    monkeypatch.setattr(stockage, "CHANGEMENTS_NOMS_MAX", 1)
+    ecrivain.appliquer({"Brann": perso("Brann"), "Cyra": perso("Cyra")}, [])
+    assert ecrivain._changements[-1] == [ecrivain.revision, None, None]
+    assert set(relire(b)) == {"Aria", "Brann", "Cyra"} and b.relectures == 1
+
+
+def test_journal_borne_en_nombre_et_en_taille():
+    changements = []
+    for rev in range(1, 200):
+        changements = _noter_changement(changements, rev, [f"perso_{rev}_" + "x" * 500], [])
+    assert len(changements) <= stockage.CHANGEMENTS_MAX
+    assert stockage._taille(changements) <= stockage.CHANGEMENTS_TAILLE_MAX
+    # Les plus récentes sont gardées, sans trou
+    revs = [c[0] for c in changements]
+    assert revs == list(range(200 - len(revs), 200))
+    enorme = _noter_changement([], 1, ["x" * stockage.CHANGEMENTS_TAILLE_MAX], [])
+    assert enorme == [[1, None, None]]